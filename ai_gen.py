@@ -1,11 +1,21 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 import pandas as pd
+import llm_cache
+from catalog import get_catalog, most_common
+from database import get_taste_profile
+from metrics import bind, count, observe, span, timed
 
-def generate_ai_explanation(user_profile, movie, api_key):
-    """Generate AI explanation using Gemini"""
-    genai.configure(api_key=api_key)
-    
-    system_prompt = """
+MODEL_NAME = "gemini-2.5-flash-lite"
+MAX_CONCURRENT_CALLS = 6
+CALL_TIMEOUT = 20
+INSIGHT_FALLBACK = "Our AI critic is taking a short break. Please try again in a moment."
+
+EXPLANATION_SYSTEM_PROMPT = """
     You are MovieReel AI, a cinematic expert who explains movie recommendations with emotional intelligence and storytelling flair.
     
     Your job is to explain why a movie is recommended to a user based on:
@@ -24,8 +34,33 @@ def generate_ai_explanation(user_profile, movie, api_key):
     Example:
     "We think you'll love Arrival because it shares the mind-bending mystery of Arrival, but with a deeply emotional core. Like Villeneuve's other films, it's visually stunning and lingers in your mind long after."
     """
-    
-    prompt = f"""
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_gemini_model(system_instruction, api_key=None, model_name=MODEL_NAME):
+    """Reuse one GenerativeModel per (api key, model, system prompt) instead of building one per call.
+
+    A model binds genai's process-wide default client on its first call, so
+    each keyed model gets its own client up front; otherwise a cached model
+    could run on whichever key another session configured last.
+    """
+    with _models_lock:
+        key = (api_key, model_name, system_instruction)
+        if key not in _models:
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                system_instruction=system_instruction
+            )
+            if api_key is not None:
+                model._client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+            _models[key] = model
+        return _models[key]
+
+
+def _explanation_prompt(user_profile, movie):
+    return f"""
     User Profile:
     - Loves directors: {', '.join(list(user_profile['liked_directors'])[:2])}
     - Enjoys actors: {', '.join(list(user_profile['liked_actors'])[:3])}
@@ -35,41 +70,114 @@ def generate_ai_explanation(user_profile, movie, api_key):
     Movie Recommended:
     - Title: {movie['title']}
     - Director: {movie['director']}
-    - Stars: {', '.join(movie['top_actors'].split(', ')[:3]) if 'top_actors_str' in movie and pd.notna(movie['top_actors']) else 'Unknown'}
-    - Genres: {', '.join(movie['genres'].split(', ') if 'genres' in movie and pd.notna(movie['genres']) else ['Unknown'])}
+    - Stars: {', '.join(movie['actors_list'][:3]) or 'Unknown'}
+    - Genres: {', '.join(movie['genres_list'] or ['Unknown'])}
     - Plot: {movie['plot'] if 'plot' in movie and pd.notna(movie['plot']) else 'No plot available'}
 
     Explain why we think the user will love this movie. Make it personal, emotional, and insightful.
     """
-    
-    try:
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-lite",
-            system_instruction=system_prompt
-        )
-        response = model.generate_content(prompt)
+
+
+def _fallback_explanation(movie):
+    return f"This {movie['genres_list'][0] if movie['genres_list'] else 'film'} shares themes with movies you've enjoyed and has excellent reviews (⭐ {movie['vote_average']}/10)."
+
+
+def generate_ai_explanation(user_profile, movie, api_key, model=None, user_id=None):
+    """Generate AI explanation using Gemini"""
+    def generate():
+        with span('llm.explanation'):
+            response = (model or get_gemini_model(EXPLANATION_SYSTEM_PROMPT, api_key)).generate_content(
+                _explanation_prompt(user_profile, movie),
+                request_options={'timeout': CALL_TIMEOUT}
+            )
         return response.text.strip()
-    except Exception as e:
-        return f"This {movie['genres'].split(',')[0] if 'genres' in movie else 'film'} shares themes with movies you've enjoyed and has excellent reviews (⭐ {movie['vote_average']}/10)."
-    
 
+    try:
+        key = llm_cache.fingerprint('explanation', MODEL_NAME, EXPLANATION_SYSTEM_PROMPT, user_profile, movie['movie_id'])
+        return llm_cache.cached_call('explanation', key, user_id, generate)
+    except Exception:
+        count('llm.fallbacks')
+        return _fallback_explanation(movie)
 
-    
 
-def get_personality(user_ratings_df):
-    
+@timed('llm.explanations')
+def generate_ai_explanations(user_profile, movies_df, api_key, model=None, user_id=None,
+                             max_concurrency=MAX_CONCURRENT_CALLS, timeout=CALL_TIMEOUT):
+    """Explanations for a whole grid, keyed by movie_id.
 
-    movies_df = pd.read_csv('data/curated_data (1).csv')
-    liked_movies = movies_df[movies_df['movie_id'].isin(user_ratings_df['movie_id'])]
-    
-    directors = [d for d in liked_movies['director'].dropna().tolist()]
-    genres = [g for genres in liked_movies['genres'].dropna() for g in genres.split(', ')]
-    actors = [a for actors in liked_movies['top_actors'].dropna() for a in actors.split(', ')]
+    Calls run concurrently on at most `max_concurrency` threads; any movie whose
+    call fails or misses its deadline gets the template explanation.
+    """
+    rows = [row for _, row in movies_df.iterrows()]
+    if not rows:
+        return {}
+    try:
+        model = model or get_gemini_model(EXPLANATION_SYSTEM_PROMPT, api_key)
+    except Exception:
+        return {row['movie_id']: _fallback_explanation(row) for row in rows}
+
+    workers = min(max_concurrency, len(rows))
+    waves = -(-len(rows) // workers)
+    deadline = time.monotonic() + timeout * waves
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = [pool.submit(bind(generate_ai_explanation), user_profile, row, api_key, model, user_id) for row in rows]
+
+    explanations = {}
+    for row, future in zip(rows, futures):
+        try:
+            explanations[row['movie_id']] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            count('llm.timeouts')
+            explanations[row['movie_id']] = _fallback_explanation(row)
+    pool.shutdown(wait=False, cancel_futures=True)
+    return explanations
+
+
+def _generate_from_prompt(prompt, api_key=None, model=None):
+    with span('llm.generate'):
+        response = (model or get_gemini_model(None, api_key)).generate_content(prompt, request_options={'timeout': CALL_TIMEOUT})
+    return response.text.strip()
+
+
+def _stream_reply(kind, prompt, user_id=None, api_key=None, model=None):
+    """Yield a reply chunk by chunk as the model produces it; a cached reply
+    comes back as one chunk and a completed stream is cached.
+    """
+    key = llm_cache.fingerprint(kind, MODEL_NAME, prompt)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    start = time.perf_counter()
+    response = (model or get_gemini_model(None, api_key)).generate_content(
+        prompt, stream=True, request_options={'timeout': CALL_TIMEOUT}
+    )
+    for chunk in response:
+        if not parts:
+            observe(f'llm.{kind}.first_chunk', start, time.perf_counter())
+        parts.append(chunk.text)
+        yield chunk.text
+    observe(f'llm.{kind}.stream', start, time.perf_counter())
+    llm_cache.put(key, ''.join(parts).strip(), kind, user_id)
+
+
+@timed('llm.personality')
+def get_personality(user_ratings_df, user_id=None, api_key=None, model=None):
+    prompt = _personality_prompt(user_ratings_df, user_id)
+    key = llm_cache.fingerprint('personality', MODEL_NAME, prompt)
+    return llm_cache.cached_call('personality', key, user_id, lambda: _generate_from_prompt(prompt, api_key, model))
+
+
+def _personality_prompt(user_ratings_df, user_id=None):
+    if user_id is not None:
+        taste = get_taste_profile(user_id)
+    else:
+        taste = get_catalog().taste_counts(user_ratings_df['movie_id'].unique())
     
-    from collections import Counter
-    top_directors = [d for d, _ in Counter(directors).most_common(3)]
-    top_genres = [g for g, _ in Counter(genres).most_common(3)]
-    top_actors = [a for a, _ in Counter(actors).most_common(3)]
+    top_directors = most_common(taste, 'director', 3)
+    top_genres = most_common(taste, 'genre', 3)
+    top_actors = most_common(taste, 'actor', 3)
     
     prompt = f"""
 You are a cinematic personality expert. Create a fun, engaging cinematic identity for a movie lover.
@@ -90,22 +198,22 @@ Format:
 ## **[PERSONALITY NAME]**
 [Description with emojis]
 """
-    model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-lite",
-            system_instruction=prompt
-        )
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return prompt
 
 
-def get_taste_evolution(user_ratings_df):
+@timed('llm.taste_evolution')
+def get_taste_evolution(user_ratings_df, user_id=None, api_key=None, model=None):
+    prompt = _taste_evolution_prompt(user_ratings_df)
+    key = llm_cache.fingerprint('taste_evolution', MODEL_NAME, prompt)
+    return llm_cache.cached_call('taste_evolution', key, user_id, lambda: _generate_from_prompt(prompt, api_key, model))
 
 
-    movies_df = pd.read_csv('data/curated_data (1).csv')
+def _taste_evolution_prompt(user_ratings_df):
+    movies_df = get_catalog().movies
 
 
     user_ratings_with_movies = user_ratings_df.merge(
-        movies_df[['movie_id', 'title', 'plot', 'release_date','genres']], 
+        movies_df[['movie_id', 'title', 'plot', 'release_date','genres_list']], 
         left_on='movie_id', 
         right_on='movie_id', 
         how='left'
@@ -119,7 +227,8 @@ def get_taste_evolution(user_ratings_df):
     movie_entries = []
     for _, row in user_ratings_with_movies.iterrows():
         plot = row['plot'] if pd.notna(row['plot']) else "No plot available"
-        movie_entries.append(f"• **{row['title']}** : **genres - {row['genres']}** : {plot}")
+        genres = ', '.join(row['genres_list']) if isinstance(row['genres_list'], tuple) else "Unknown"
+        movie_entries.append(f"• **{row['title']}** : **genres - {genres}** : {plot}")
     
     prompt = f"""
 You are a cinematic taste analyst. Help users understand their movie journey.
@@ -139,9 +248,52 @@ Example format:
 
 Make it feel personal and cinematic. 🌟
 """
-    model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash-lite",
-            system_instruction=prompt
-        )
-    response = model.generate_content(prompt)
-    return response.text.strip()
\ No newline at end of file
+    return prompt
+
+
+def stream_insights(user_ratings_df, user_id=None, api_key=None, model=None, timeout=CALL_TIMEOUT):
+    """Yield (panel, text so far) while the personality and taste-evolution
+    replies stream in, on the session's `api_key`.
+
+    Both prompts are sent at once on their own threads, so the first text
+    arrives after one model's time-to-first-token instead of after a whole
+    reply. A panel whose call fails before any text, or stalls for `timeout`
+    seconds, gets INSIGHT_FALLBACK.
+    """
+    prompts = {
+        'personality': _personality_prompt(user_ratings_df, user_id),
+        'taste_evolution': _taste_evolution_prompt(user_ratings_df),
+    }
+    events = queue.Queue()
+
+    def pump(kind):
+        try:
+            for text in _stream_reply(kind, prompts[kind], user_id, api_key, model):
+                events.put((kind, text))
+        except Exception:
+            count('llm.fallbacks')
+            events.put((kind, False))
+        finally:
+            events.put((kind, None))
+
+    for kind in prompts:
+        threading.Thread(target=bind(pump), args=(kind,), daemon=True).start()
+
+    texts = dict.fromkeys(prompts, '')
+    pending = set(prompts)
+    while pending:
+        try:
+            kind, text = events.get(timeout=timeout)
+        except queue.Empty:
+            count('llm.timeouts')
+            for kind in pending:
+                yield kind, texts[kind] or INSIGHT_FALLBACK
+            return
+        if text is None:
+            pending.discard(kind)
+        elif text is False:
+            texts[kind] = texts[kind] or INSIGHT_FALLBACK
+            yield kind, texts[kind]
+        else:
+            texts[kind] += text
+            yield kind, texts[kind]
\ No newline at end of file
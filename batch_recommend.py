@@ -0,0 +1,81 @@
+"""Offline precompute of every user's recommendation lists.
+
+Run `python batch_recommend.py` (e.g. nightly or after publishing a model).
+Users are read in chunks and scored on a process pool; the catalog, model,
+content engine and indexes are loaded once in the parent before the pool
+forks, so workers share those pages instead of each loading a copy. The
+lists land in `user_recommendations`, which the UI reads first; users whose
+stored lists are still fresh are skipped.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import db_pool
+from content_engine import get_content_engine
+from database import get_stored_recommendations, get_user_ratings, iter_rated_user_ids, store_recommendations
+from model_registry import get_model
+from rankings import get_rankings
+from recommendation import PRECOMPUTED, recommendation_version
+from retrieval import get_index
+
+CHUNK_SIZE = 64
+TOP_K = 12
+
+
+def _warm():
+    model = get_model()
+    get_content_engine()
+    get_rankings()
+    get_index(model)
+
+
+def _compute_chunk(user_ids, top_k, force):
+    """Recompute stale lists for a chunk of users; returns rows for store_recommendations"""
+    rows = []
+    for user_id in user_ids:
+        ratings = get_user_ratings(user_id)
+        version = recommendation_version(ratings)
+        for kind, recommend in PRECOMPUTED.items():
+            stored = get_stored_recommendations(user_id, kind)
+            if not force and stored is not None and stored[0] == version:
+                continue
+            recs = recommend(ratings, top_k, user_id)
+            rows.append((user_id, kind, version, recs['movie_id'].tolist()))
+    return rows
+
+
+def run(workers=None, chunk_size=CHUNK_SIZE, top_k=TOP_K, force=False):
+    """Precompute lists for every rated user; returns counts and users/second"""
+    _warm()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+    start = time.perf_counter()
+    chunks = list(iter_rated_user_ids(chunk_size))
+    lists = 0
+    db_pool.close_pools()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=db_pool.reset_pools) as pool:
+        for rows in pool.map(_compute_chunk, chunks, repeat(top_k), repeat(force)):
+            if rows:
+                store_recommendations(rows)
+            lists += len(rows)
+    elapsed = time.perf_counter() - start
+    users = sum(len(chunk) for chunk in chunks)
+    return {'users': users, 'lists': lists, 'seconds': elapsed, 'users_per_second': users / max(elapsed, 1e-9)}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute recommendation lists for every user")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--force', action='store_true', help="recompute lists that are still fresh")
+    args = parser.parse_args()
+
+    result = run(args.workers, args.chunk_size, args.top_k, args.force)
+    print(f"{result['users']} users, {result['lists']} lists in {result['seconds']:.1f}s "
+          f"({result['users_per_second']:.1f} users/s)")
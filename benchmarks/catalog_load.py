@@ -0,0 +1,59 @@
+"""Cold-start time and peak RSS of loading the catalog from CSV vs the columnar format.
+
+    python -m benchmarks.catalog_load --sizes 100000 1000000
+
+Each load runs in a fresh interpreter so RSS is not shared between runs.
+Prints one JSON object per (size, format).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# ru_maxrss survives fork+exec on Linux, so peak RSS is read from VmHWM instead.
+LOAD_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from catalog import load_catalog
+imported = time.perf_counter()
+catalog = load_catalog(sys.argv[1])
+loaded = time.perf_counter()
+with open('/proc/self/status') as f:
+    status = dict(line.split(':', 1) for line in f)
+print(json.dumps({'import_seconds': imported - start, 'load_seconds': loaded - imported,
+                  'rows': len(catalog),
+                  'peak_rss_mb': int(status['VmHWM'].split()[0]) / 1024,
+                  'rss_mb': int(status['VmRSS'].split()[0]) / 1024}))
+"""
+
+
+def measure(path):
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, '-c', LOAD_SNIPPET, path], cwd=repo,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import make_catalog
+    from catalog import load_catalog
+    from catalog_format import write_columnar
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            csv_path = os.path.join(tmp, f'catalog_{size}.csv')
+            cols_path = os.path.join(tmp, f'catalog_{size}.cols')
+            make_catalog(size).to_csv(csv_path, index=False)
+            write_columnar(load_catalog(csv_path), cols_path)
+            for fmt, path in (('csv', csv_path), ('columnar', cols_path)):
+                print(json.dumps({'size': size, 'format': fmt, **measure(path)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Serial vs concurrent grid explanations against the fake Gemini client.
+
+    python -m benchmarks.explanations --movies 12 --latency 0.5
+"""
+import argparse
+import time
+import pandas as pd
+from ai_gen import generate_ai_explanation, generate_ai_explanations
+from benchmarks.fake_gemini import FakeGenerativeModel, scratch_llm_cache
+
+
+def _grid(n):
+    return pd.DataFrame({
+        'movie_id': range(n),
+        'title': [f"Movie {i}" for i in range(n)],
+        'director': "Denis Villeneuve",
+        'actors_list': [("Amy Adams", "Jeremy Renner")] * n,
+        'genres_list': [("Drama", "Science Fiction")] * n,
+        'plot': "A linguist is recruited to talk to visitors.",
+        'vote_average': 7.9,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--movies', type=int, default=12)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=6)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+
+    grid = _grid(args.movies)
+    profile = {'liked_directors': {"Denis Villeneuve"}, 'liked_actors': {"Amy Adams"}, 'liked_genres': {"Drama"}}
+
+    model = FakeGenerativeModel(args.latency, args.fail_every)
+    with scratch_llm_cache():
+        start = time.perf_counter()
+        for _, row in grid.iterrows():
+            generate_ai_explanation(profile, row, None, model=model)
+        serial = time.perf_counter() - start
+
+    model = FakeGenerativeModel(args.latency, args.fail_every)
+    with scratch_llm_cache():
+        start = time.perf_counter()
+        explanations = generate_ai_explanations(profile, grid, None, model=model, max_concurrency=args.concurrency)
+        concurrent = time.perf_counter() - start
+
+    print(f"serial:     {serial:.2f}s for {args.movies} explanations")
+    print(f"concurrent: {concurrent:.2f}s (peak in flight {model.peak_in_flight}, "
+          f"{len(explanations)} explanations)")
+    print(f"speedup:    {serial / concurrent:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import llm_cache
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Local stand-in for `genai.GenerativeModel` with a fixed per-call latency.
+
+    With `stream=True` the reply arrives as `stream_chunks` pieces: the first
+    after `first_chunk_latency`, the rest spread over the remaining latency.
+    Records how many calls were made and the peak number in flight so callers
+    can check concurrency bounds.
+    """
+
+    def __init__(self, latency=0.5, fail_every=0, reply="We think you'll love this one.",
+                 stream_chunks=10, first_chunk_latency=None):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.reply = reply
+        self.stream_chunks = stream_chunks
+        self.first_chunk_latency = latency / stream_chunks if first_chunk_latency is None else first_chunk_latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self.calls
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._stream()
+        call = self._start()
+        try:
+            time.sleep(self.latency)
+            if self.fail_every and call % self.fail_every == 0:
+                raise RuntimeError("fake Gemini failure")
+            return FakeResponse(self.reply)
+        finally:
+            self._finish()
+
+    def _stream(self):
+        call = self._start()
+        try:
+            words = self.reply.split(' ')
+            step = -(-len(words) // self.stream_chunks)
+            pieces = [' '.join(words[i:i + step]) + ' ' for i in range(0, len(words), step)]
+            rest = (self.latency - self.first_chunk_latency) / max(len(pieces) - 1, 1)
+            for i, piece in enumerate(pieces):
+                time.sleep(self.first_chunk_latency if i == 0 else rest)
+                if self.fail_every and call % self.fail_every == 0:
+                    raise RuntimeError("fake Gemini failure")
+                yield FakeResponse(piece)
+        finally:
+            self._finish()
+
+
+@contextmanager
+def scratch_llm_cache():
+    """Point the LLM cache at an empty throwaway database so timed runs make real calls"""
+    directory = tempfile.mkdtemp()
+    previous = llm_cache.CACHE_PATH
+    llm_cache.CACHE_PATH = os.path.join(directory, 'llm_cache.db')
+    llm_cache.init_cache()
+    try:
+        yield
+    finally:
+        llm_cache.CACHE_PATH = previous
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,57 @@
+"""Blocking vs streamed personality/taste panels against the fake Gemini client.
+
+    python -m benchmarks.insights --latency 2.0 --first-chunk 0.3
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from ai_gen import get_personality, get_taste_evolution, stream_insights
+from benchmarks.fake_gemini import FakeGenerativeModel, scratch_llm_cache
+from catalog import get_catalog
+
+
+def _ratings(n, seed=0):
+    movie_ids = get_catalog().movie_ids
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'movie_id': rng.choice(movie_ids, min(n, len(movie_ids)), replace=False),
+        'rating': 5,
+        'timestamp': pd.date_range('2024-01-01', periods=min(n, len(movie_ids)), freq='D').astype(str),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=2.0, help="seconds for a full reply")
+    parser.add_argument('--first-chunk', type=float, default=0.3, help="seconds to the first streamed chunk")
+    parser.add_argument('--ratings', type=int, default=25)
+    args = parser.parse_args()
+
+    ratings = _ratings(args.ratings)
+    reply = "Your cinematic journey " * 20
+
+    model = FakeGenerativeModel(args.latency, reply=reply, first_chunk_latency=args.first_chunk)
+    with scratch_llm_cache():
+        start = time.perf_counter()
+        get_personality(ratings, model=model)
+        blocking_first = time.perf_counter() - start
+        get_taste_evolution(ratings, model=model)
+        blocking_total = time.perf_counter() - start
+
+    model = FakeGenerativeModel(args.latency, reply=reply, first_chunk_latency=args.first_chunk)
+    with scratch_llm_cache():
+        start = time.perf_counter()
+        streamed_first = None
+        for _ in stream_insights(ratings, model=model):
+            if streamed_first is None:
+                streamed_first = time.perf_counter() - start
+        streamed_total = time.perf_counter() - start
+
+    print(f"blocking: first text {blocking_first:.2f}s, both panels {blocking_total:.2f}s")
+    print(f"streamed: first text {streamed_first:.2f}s, both panels {streamed_total:.2f}s "
+          f"(peak in flight {model.peak_in_flight})")
+
+
+if __name__ == '__main__':
+    main()
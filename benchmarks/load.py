@@ -0,0 +1,224 @@
+"""Concurrent sessions against one users.db and catalog, as concurrency rises.
+
+    python -m benchmarks.load --sessions 1 4 16 64 --mode processes --workers 4 --duration 30
+
+Each simulated session registers and logs in, then loops until the
+deadline: a burst of `save_rating` calls, a read of its ratings, and the
+general, content, NCF and hybrid recommendations. With --explain it also
+asks the fake Gemini backend (latency set by --gemini-latency) for the grid
+explanations. In --mode threads every session is a thread of one process,
+as in a single Streamlit server; in --mode processes they are split across
+--workers spawned processes, as in several servers sharing one database.
+
+Runs in a scratch workspace built like benchmarks.suite (synthetic catalog,
+NCF artifact, users.db seeded with --seed-users). Each concurrency level
+reports throughput, per-operation latency percentiles, errors (SQLite
+"database is locked" counted separately, including locks hit by the
+background rating flush) and peak RSS per worker.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from benchmarks.suite import run_stage, summary
+
+TOP_K = 12
+PASSWORD = "load-test"
+
+
+def _peak_rss_mb():
+    with open('/proc/self/status') as f:
+        status = dict(line.split(':', 1) for line in f)
+    return int(status['VmHWM'].split()[0]) / 1024
+
+
+def _warm():
+    from content_engine import get_content_engine
+    from model_registry import get_model
+    from rankings import get_rankings
+    from retrieval import get_index
+
+    model = get_model()
+    get_content_engine()
+    get_rankings()
+    get_index(model)
+
+
+class _Recorder:
+    """Latencies and errors per operation, shared by the sessions of one worker"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            locked = isinstance(e, sqlite3.OperationalError) and 'locked' in str(e)
+            with self._lock:
+                self.errors[f"{name}:{'locked' if locked else type(e).__name__}"] += 1
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.setdefault(name, []).append(elapsed)
+        return result
+
+
+def _session(index, deadline, options, recorder, model):
+    from ai_gen import generate_ai_explanations
+    from catalog import get_catalog, liked_profile
+    from database import authenticate_user, get_taste_profile, get_user_ratings, register_user, save_rating
+    from recommendation import get_general_recommendations, get_ncf_recommendations, get_recommendations
+
+    rng = np.random.default_rng([os.getpid(), index])
+    username = f"load_{os.getpid()}_{index}_{time.time_ns()}"
+    recorder.call('register', register_user, username, PASSWORD)
+    user_id = recorder.call('login', authenticate_user, username, PASSWORD)
+    if user_id is None:
+        return
+    movie_ids = get_catalog().movie_ids
+    while time.monotonic() < deadline:
+        for movie_id in rng.choice(movie_ids, options['burst'], replace=False):
+            recorder.call('save_rating', save_rating, user_id, int(movie_id), int(rng.integers(4, 6)))
+        ratings = recorder.call('get_user_ratings', get_user_ratings, user_id)
+        if ratings is None:
+            continue
+        recorder.call('general', get_general_recommendations, TOP_K)
+        recs = recorder.call('content', get_recommendations, 'content', ratings, TOP_K, user_id)
+        recorder.call('ncf', get_ncf_recommendations, ratings, TOP_K, user_id)
+        recorder.call('hybrid', get_recommendations, 'hybrid', ratings, TOP_K, user_id)
+        if options['explain'] and recs is not None:
+            profile = liked_profile(get_taste_profile(user_id))
+            recorder.call('explanations', generate_ai_explanations, profile, recs, None, model=model, user_id=user_id)
+        time.sleep(options['think'])
+
+
+def run_worker(sessions, options):
+    """Run `sessions` concurrent sessions on threads of this process for options['duration'] seconds"""
+    import metrics
+    from benchmarks.fake_gemini import FakeGenerativeModel
+    from database import flush_ratings
+
+    metrics.enable()
+    _warm()
+    model = FakeGenerativeModel(options['gemini_latency'])
+    recorder = _Recorder()
+    deadline = time.monotonic() + options['duration']
+    threads = [threading.Thread(target=_session, args=(i, deadline, options, recorder, model), daemon=True)
+               for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    flush_ratings()
+    counters = metrics.snapshot()['counters']
+    return {
+        'seconds': time.perf_counter() - start,
+        'samples': recorder.samples,
+        'errors': dict(recorder.errors),
+        'flush_errors': counters.get('db.flush_errors', 0),
+        'flush_locked': counters.get('db.flush_locked', 0),
+        'peak_rss_mb': _peak_rss_mb(),
+        'gemini_calls': model.calls,
+    }
+
+
+def run_level(sessions, mode, workers, options):
+    """One concurrency level in the current workspace; returns the merged report"""
+    if mode == 'threads':
+        results = [run_worker(sessions, options)]
+    else:
+        workers = min(workers, sessions)
+        shares = [len(part) for part in np.array_split(np.arange(sessions), workers)]
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(run_worker, shares, [options] * workers))
+
+    samples, errors = {}, Counter()
+    for result in results:
+        for name, values in result['samples'].items():
+            samples.setdefault(name, []).extend(values)
+        errors.update(result['errors'])
+    seconds = max(result['seconds'] for result in results)
+    operations = sum(len(values) for values in samples.values())
+    return {
+        'sessions': sessions,
+        'mode': mode,
+        'workers': len(results),
+        'seconds': seconds,
+        'operations': operations,
+        'throughput_per_s': operations / seconds,
+        'latency': {name: summary(values) for name, values in samples.items()},
+        'errors': dict(errors),
+        'locked_errors': sum(n for key, n in errors.items() if key.endswith(':locked')),
+        'flush_errors': sum(result['flush_errors'] for result in results),
+        'flush_locked': sum(result['flush_locked'] for result in results),
+        'peak_rss_mb_per_worker': [result['peak_rss_mb'] for result in results],
+        'gemini_calls': sum(result['gemini_calls'] for result in results),
+    }
+
+
+def _print_level(level):
+    latency = level['latency']
+    tails = '  '.join(f"{name} p95 {latency[name]['p95_ms']:.0f}ms"
+                      for name in ('save_rating', 'content', 'hybrid', 'explanations') if name in latency)
+    print(f"{level['sessions']:>4} sessions ({level['mode']}, {level['workers']} workers): "
+          f"{level['throughput_per_s']:8.1f} ops/s  locked {level['locked_errors'] + level['flush_locked']:>4}  "
+          f"rss {max(level['peak_rss_mb_per_worker']):.0f} MB/worker  {tails}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 16, 64], help="concurrency levels")
+    parser.add_argument('--mode', choices=('threads', 'processes'), default='threads')
+    parser.add_argument('--workers', type=int, default=4, help="processes in --mode processes")
+    parser.add_argument('--duration', type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument('--burst', type=int, default=5, help="ratings saved per loop")
+    parser.add_argument('--think', type=float, default=0.1, help="seconds a session idles per loop")
+    parser.add_argument('--explain', action='store_true', help="request grid explanations from fake Gemini")
+    parser.add_argument('--gemini-latency', type=float, default=1.0)
+    parser.add_argument('--size', type=int, default=10_000, help="synthetic catalog titles")
+    parser.add_argument('--seed-users', type=int, default=1000, help="users with ratings before the run")
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    parser.add_argument('--stage', choices=('level',), help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage == 'level':
+        print(json.dumps(run_level(args.sessions[0], args.mode, args.workers, json.loads(args.options))))
+        return
+
+    options = {'duration': args.duration, 'burst': args.burst, 'think': args.think,
+               'explain': args.explain, 'gemini_latency': args.gemini_latency}
+    report = []
+    with tempfile.TemporaryDirectory() as workspace:
+        run_stage('setup', workspace, ['--size', str(args.size), '--users', str(args.seed_users)])
+        for sessions in args.sessions:
+            level = run_stage('level', workspace, ['--sessions', str(sessions), '--mode', args.mode,
+                                                   '--workers', str(args.workers),
+                                                   '--options', json.dumps(options)], module='benchmarks.load')
+            _print_level(level)
+            report.append(level)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
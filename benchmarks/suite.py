@@ -0,0 +1,182 @@
+"""Latency, throughput and peak memory of the recommendation paths and rating store.
+
+    python -m benchmarks.suite --sizes 10000 100000 1000000 --users 1000 --out bench.json
+
+For each catalog size a scratch workspace gets a synthetic columnar catalog,
+a published NCF artifact (plus IVF index), and a users.db filled with
+synthetic ratings. The measurements then run in a fresh interpreter inside
+that workspace, so module-level caches and peak RSS start clean. Output is
+a JSON list with one object per size.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOP_K = 12
+
+
+def setup(size, users, dim, ivf, seed=0):
+    """Write catalog, model and users.db into the current directory"""
+    from benchmarks.synthetic import make_catalog, make_embeddings, make_ratings
+    from catalog import Catalog
+    from catalog_format import COLUMNAR_CATALOG_PATH, write_columnar
+    from model_registry import MODEL_ROOT, publish
+
+    os.makedirs('data', exist_ok=True)
+    os.makedirs('database', exist_ok=True)
+    start = time.perf_counter()
+    movies = make_catalog(size, seed)
+    write_columnar(Catalog(movies), COLUMNAR_CATALOG_PATH)
+    movie_ids, embeddings = make_embeddings(movies, dim, seed)
+    version = publish(movie_ids, embeddings, MODEL_ROOT)
+    if ivf:
+        from retrieval import IVF_INDEX_PATH, IVFIndex
+        IVFIndex.build(embeddings, version).save(IVF_INDEX_PATH)
+
+    import database
+    ratings = make_ratings(movie_ids, users, seed=seed)
+    with database.connection() as conn:
+        conn.executemany("INSERT INTO users (user_id, username, password_hash) VALUES (?, ?, ?)",
+                         [(u, f"user{u}", database.hash_password("benchmark")) for u in range(1, users + 1)])
+        conn.executemany("INSERT INTO user_ratings (user_id, movie_id, rating, timestamp) VALUES (?, ?, ?, ?)",
+                         ratings.itertuples(index=False, name=None))
+        conn.commit()
+    return {'setup_seconds': time.perf_counter() - start, 'ratings': len(ratings)}
+
+
+def summary(samples):
+    ms = np.asarray(samples) * 1000
+    total = float(np.sum(samples))
+    return {
+        'count': len(ms),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+        'throughput_per_s': len(ms) / total if total > 0 else None,
+    }
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def measure(sample_users, repeats, seed=0):
+    """Time every path against the workspace in the current directory"""
+    start = time.perf_counter()
+    import database
+    from catalog import get_catalog
+    from content_engine import get_content_engine
+    from model_registry import get_model
+    from rankings import get_rankings
+    from recommendation import (get_content_based_recommendations, get_general_recommendations,
+                                get_hybrid_recommendations, get_ncf_recommendations)
+    from retrieval import get_index
+    imported = time.perf_counter()
+    catalog = get_catalog()
+    model = get_model()
+    get_content_engine()
+    get_rankings()
+    get_index(model)
+    warm = time.perf_counter()
+
+    rng = np.random.default_rng(seed)
+    with database.connection() as conn:
+        rated = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM user_ratings")]
+    users = [int(u) for u in rng.choice(rated, min(sample_users, len(rated)), replace=False)]
+    ratings = {u: database.get_user_ratings(u) for u in users}
+
+    # First reads backfill each user's taste counts and embedding; time them on their own.
+    backfill = [_timed(lambda u: (database.get_taste_profile(u), database.get_user_embedding(u)), u) for u in users]
+
+    samples = {name: [] for name in (
+        'general', 'content', 'ncf', 'hybrid',
+        'db.get_user_ratings', 'db.get_rating_count', 'db.get_taste_profile', 'db.get_rating',
+        'db.save_rating', 'db.flush_ratings',
+    )}
+    for _ in range(repeats):
+        samples['general'].append(_timed(get_general_recommendations, TOP_K))
+    for u in users:
+        df = ratings[u]
+        samples['content'].append(_timed(get_content_based_recommendations, df, TOP_K, u))
+        samples['ncf'].append(_timed(get_ncf_recommendations, df, TOP_K, u))
+        samples['hybrid'].append(_timed(get_hybrid_recommendations, df, TOP_K, u))
+        samples['db.get_user_ratings'].append(_timed(database.get_user_ratings, u))
+        samples['db.get_rating_count'].append(_timed(database.get_rating_count, u))
+        samples['db.get_taste_profile'].append(_timed(database.get_taste_profile, u))
+        samples['db.get_rating'].append(_timed(database.get_rating, u, int(df['movie_id'].iloc[0])))
+        samples['db.save_rating'].append(_timed(database.save_rating, u, int(rng.choice(catalog.movie_ids)), 5))
+        samples['db.flush_ratings'].append(_timed(database.flush_ratings))
+
+    with open('/proc/self/status') as f:
+        status = dict(line.split(':', 1) for line in f)
+    return {
+        'import_seconds': imported - start,
+        'load_seconds': warm - imported,
+        'sample_users': len(users),
+        'backfill': summary(backfill),
+        'operations': {name: summary(values) for name, values in samples.items() if values},
+        'peak_rss_mb': int(status['VmHWM'].split()[0]) / 1024,
+        'rss_mb': int(status['VmRSS'].split()[0]) / 1024,
+    }
+
+
+def run_stage(stage, workspace, args, module='benchmarks.suite'):
+    """Run `python -m module --stage stage` in `workspace`; returns the JSON it prints last"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get('PYTHONPATH')])))
+    out = subprocess.run([sys.executable, '-m', module, '--stage', stage, *args], cwd=workspace,
+                         env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"{stage} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sample-users', type=int, default=100, help="users timed per path")
+    parser.add_argument('--repeats', type=int, default=200, help="calls of the non-personal paths")
+    parser.add_argument('--dim', type=int, default=32)
+    parser.add_argument('--no-ivf', action='store_true', help="benchmark exact NCF search")
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    parser.add_argument('--stage', choices=('setup', 'measure'), help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage == 'setup':
+        print(json.dumps(setup(args.size, args.users, args.dim, not args.no_ivf)))
+        return
+    if args.stage == 'measure':
+        print(json.dumps(measure(args.sample_users, args.repeats)))
+        return
+
+    report = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workspace:
+            common = ['--users', str(args.users), '--dim', str(args.dim)] + (['--no-ivf'] if args.no_ivf else [])
+            built = run_stage('setup', workspace, ['--size', str(size), *common])
+            measured = run_stage('measure', workspace, ['--sample-users', str(args.sample_users),
+                                                   '--repeats', str(args.repeats)])
+            report.append({'size': size, 'users': args.users, 'dim': args.dim, 'ivf': not args.no_ivf,
+                           **built, **measured})
+            print(f"size={size}: done", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
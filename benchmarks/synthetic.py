@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from data.director import TOP_DIRECTORS
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama",
+          "Family", "Fantasy", "History", "Horror", "Music", "Mystery", "Romance",
+          "Science Fiction", "Thriller", "War", "Western"]
+
+
+def _popular(rng, n_names, size, offset=200, exponent=0.8):
+    """Indices drawn with Zipf-Mandelbrot weights 1 / (rank + offset) ** exponent:
+    a long tail with a flattened head, so no single name covers more than a
+    fraction of a percent of a large catalog (plain Zipf gives one name a
+    quarter of it).
+    """
+    weights = 1.0 / (np.arange(n_names) + offset) ** exponent
+    cdf = np.cumsum(weights)
+    return np.minimum(np.searchsorted(cdf, rng.random(size) * cdf[-1]), n_names - 1)
+
+
+def make_catalog(n, seed=0):
+    """Synthetic catalog in the curated_data CSV schema.
+
+    Directors and actors follow a Zipf-like popularity so a few names cover
+    many titles, as in the real data, without any one name dominating. The
+    most prolific directors are the curated TOP_DIRECTORS, so the General tab
+    has something to show.
+    """
+    rng = np.random.default_rng(seed)
+    n_directors = max(n // 8, 10)
+    n_actors = max(n // 2, 30)
+    directors = np.array([f"Director {i}" for i in range(n_directors)], dtype=object)
+    curated = list(dict.fromkeys(TOP_DIRECTORS))[:n_directors]
+    directors[:len(curated)] = curated
+    actors = np.array([f"Actor {i}" for i in range(n_actors)], dtype=object)
+
+    director_idx = _popular(rng, n_directors, n)
+    actor_idx = _popular(rng, n_actors, (n, 3))
+    genre_counts = rng.integers(1, 4, n)
+    genre_idx = rng.integers(0, len(GENRES), (n, 3))
+
+    movie_ids = rng.choice(max(4 * n, 1000), n, replace=False) + 1
+    top_actors = [", ".join(dict.fromkeys(actors[row])) for row in actor_idx]
+    return pd.DataFrame({
+        'movie_id': movie_ids,
+        'title': [f"Movie {i}" for i in movie_ids],
+        'plot': [f"Plot of movie {i}." for i in movie_ids],
+        'poster_path': [f"/poster{i}.jpg" for i in movie_ids],
+        'genres': [", ".join(dict.fromkeys(GENRES[g] for g in row[:c])) for row, c in zip(genre_idx, genre_counts)],
+        'director': directors[director_idx],
+        'top_actors': top_actors,
+        'release_date': pd.to_datetime(rng.integers(0, 20000, n), unit='D', origin='1970-01-01').strftime('%Y-%m-%d'),
+        'vote_average': np.round(np.clip(rng.normal(6.5, 1.0, n), 0, 10), 1),
+        'runtime': rng.integers(70, 180, n),
+        'top_actors_str': top_actors,
+    })
+
+
+def make_embeddings(movies, dim=32, seed=0):
+    """Item embeddings shaped like the NCF artifact, one row per catalog movie.
+
+    Titles by the same director share a direction plus noise, so nearest
+    neighbours and pseudo-user queries behave like trained embeddings rather
+    than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    codes, _ = pd.factorize(movies['director'])
+    centers = rng.normal(size=(codes.max() + 1, dim)).astype(np.float32)
+    noise = rng.normal(scale=0.5, size=(len(movies), dim)).astype(np.float32)
+    return movies['movie_id'].to_numpy(dtype=np.int64), centers[codes] + noise
+
+
+def make_ratings(movie_ids, n_users, median_ratings=30, seed=0):
+    """Ratings in the user_ratings schema (user_id, movie_id, rating, timestamp).
+
+    Ratings per user are log-normal around `median_ratings`, titles are drawn
+    by Zipf popularity, scores lean towards 4 and 5, and timestamps spread
+    over the last year. Repeated (user, movie) pairs are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    counts = np.clip(rng.lognormal(np.log(median_ratings), 0.8, n_users).astype(np.int64), 1, 500)
+    user_ids = np.repeat(np.arange(1, n_users + 1), counts)
+
+    popularity = 1.0 / np.arange(1, len(movie_ids) + 1) ** 0.8
+    cdf = np.cumsum(popularity[rng.permutation(len(movie_ids))])
+    picks = np.minimum(np.searchsorted(cdf, rng.random(len(user_ids)) * cdf[-1]), len(movie_ids) - 1)
+    pairs = np.unique(user_ids * len(movie_ids) + picks)
+    user_ids, picks = pairs // len(movie_ids), pairs % len(movie_ids)
+
+    now = pd.Timestamp.now(tz='UTC').floor('s').tz_localize(None)
+    stamps = now - pd.to_timedelta(rng.integers(0, 365 * 86400, len(pairs)), unit='s')
+    return pd.DataFrame({
+        'user_id': user_ids,
+        'movie_id': movie_ids[picks],
+        'rating': rng.choice([1, 2, 3, 4, 5], len(pairs), p=[0.04, 0.08, 0.18, 0.38, 0.32]),
+        'timestamp': stamps.strftime('%Y-%m-%d %H:%M:%S'),
+    })
@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import Counter
+import numpy as np
+import pandas as pd
+from catalog_format import COLUMNAR_CATALOG_PATH, MANIFEST, read_columnar
+from metrics import timed
+
+CATALOG_PATH = 'data/curated_data (1).csv'
+LEAD_ACTORS = 3   # billed actors per liked movie that feed the content recommender
+
+_lock = threading.Lock()
+_cached = None
+
+
+def split_list(value):
+    """Split a comma-joined catalog cell into a tuple of clean names"""
+    if isinstance(value, (list, tuple)):
+        return tuple(v.strip() for v in value if isinstance(v, str) and v.strip())
+    if not isinstance(value, str):
+        return ()
+    return tuple(v.strip() for v in value.split(',') if v.strip())
+
+
+class Catalog:
+    """Immutable, pre-parsed movie catalog shared by every session in the process.
+
+    `movies` must be treated as read-only; callers that need to add columns
+    take a `.copy()` of the slice they work on.
+    """
+
+    def __init__(self, movies, version=None, codes=None):
+        movies = movies.reset_index(drop=True)
+        movies['release_date'] = pd.to_datetime(movies['release_date'], errors='coerce')
+
+        # codes: {'genres'|'actors': (offsets, values, vocabulary)} from the columnar format
+        self.codes = codes
+        if codes is None:
+            actor_col = 'top_actors' if 'top_actors' in movies else 'top_actors_str'
+            self.genre_lists = tuple(split_list(g) for g in movies['genres'])
+            self.actor_lists = tuple(split_list(a) for a in movies[actor_col])
+        else:
+            self.genre_lists = _decode_lists(*codes['genres'])
+            self.actor_lists = _decode_lists(*codes['actors'])
+        movies['genres_list'] = np.fromiter(self.genre_lists, dtype=object, count=len(movies))
+        movies['actors_list'] = np.fromiter(self.actor_lists, dtype=object, count=len(movies))
+
+        self.movies = movies
+        self.version = version
+        self.movie_ids = movies['movie_id'].to_numpy()
+        self.index = {mid: pos for pos, mid in enumerate(self.movie_ids.tolist())}
+
+    def __len__(self):
+        return len(self.movies)
+
+    def positions(self, movie_ids):
+        """Row positions of the given ids, skipping ids not in the catalog"""
+        index = self.index
+        return [index[mid] for mid in movie_ids if mid in index]
+
+    def rows(self, movie_ids):
+        """Catalog rows for the given ids, in the order they were given"""
+        return self.movies.iloc[self.positions(movie_ids)]
+
+    def row(self, movie_id):
+        pos = self.index.get(movie_id)
+        return None if pos is None else self.movies.iloc[pos]
+
+    def taste_counts(self, movie_ids):
+        """Counter of (kind, name) -> how many of the given movies have that director/actor/genre.
+
+        Kind 'lead' counts only each movie's first LEAD_ACTORS actors.
+        """
+        counts = Counter()
+        directors = self.movies['director']
+        for pos in self.positions(movie_ids):
+            director = directors.iat[pos]
+            if isinstance(director, str) and director != "Unknown":
+                counts['director', director] += 1
+            counts.update(('actor', a) for a in set(self.actor_lists[pos]))
+            counts.update(('lead', a) for a in set(self.actor_lists[pos][:LEAD_ACTORS]))
+            counts.update(('genre', g) for g in set(self.genre_lists[pos]))
+        return counts
+
+
+def _decode_lists(offsets, values, vocab):
+    names = np.asarray(vocab, dtype=object)[values].tolist()
+    bounds = offsets.tolist()
+    return tuple(tuple(names[start:end]) for start, end in zip(bounds, bounds[1:]))
+
+
+def liked_profile(taste_counts):
+    """Director/actor/genre sets of a taste profile, as used by the UI and prompts"""
+    profile = {'liked_directors': set(), 'liked_actors': set(), 'liked_genres': set()}
+    for kind, name in taste_counts:
+        if kind != 'lead':
+            profile[f'liked_{kind}s'].add(name)
+    return profile
+
+
+def lead_actors(taste_counts):
+    """Top-billed actors of the rated movies, as scored by the content recommender"""
+    return {name for kind, name in taste_counts if kind == 'lead'}
+
+
+def most_common(taste_counts, kind, n):
+    """The n names of one kind that appear in the most rated movies"""
+    ranked = sorted(((c, name) for (k, name), c in taste_counts.items() if k == kind),
+                    key=lambda item: -item[0])
+    return [name for _, name in ranked[:n]]
+
+
+def _file_version(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST)
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def default_catalog_path():
+    """The columnar catalog when one has been built, else the CSV"""
+    if os.path.exists(os.path.join(COLUMNAR_CATALOG_PATH, MANIFEST)):
+        return COLUMNAR_CATALOG_PATH
+    return CATALOG_PATH
+
+
+@timed('catalog.load')
+def load_catalog(path=None):
+    """Load the catalog file or columnar directory into a fresh `Catalog` (no caching)"""
+    path = path or default_catalog_path()
+    version = _file_version(path)
+    if os.path.isdir(path):
+        movies, codes = read_columnar(path)
+        return Catalog(movies, version=version, codes=codes)
+    return Catalog(pd.read_csv(path), version=version)
+
+
+def get_catalog(path=None):
+    """Process-wide catalog, reloaded only when the file on disk changes"""
+    global _cached
+    path = path or default_catalog_path()
+    version = _file_version(path)
+    cached = _cached
+    if cached is not None and cached[0] == path and cached[1].version == version:
+        return cached[1]
+    with _lock:
+        cached = _cached
+        if cached is None or cached[0] != path or cached[1].version != _file_version(path):
+            _cached = (path, load_catalog(path))
+        return _cached[1]
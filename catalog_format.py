@@ -0,0 +1,137 @@
+"""Columnar binary catalog format.
+
+A catalog directory holds one .npy file per array plus manifest.json:
+
+* numeric and date columns are stored as-is and memory-mapped on load;
+* `director` is dictionary-encoded (int32 codes + vocabulary);
+* other text columns are NUL-separated UTF-8 with int64 offsets;
+* genre and actor lists are offset-encoded int32 codes into their vocabularies.
+
+Convert the shipped CSV with `python catalog_format.py`.
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+COLUMNAR_CATALOG_PATH = 'data/curated_data.cols'
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+CATEGORICAL_COLUMNS = ('director',)
+LIST_COLUMNS = ('genres', 'actors')
+# Raw comma-joined text the lists were parsed from; not stored.
+SOURCE_LIST_COLUMNS = ('genres', 'top_actors', 'top_actors_str', 'genres_list', 'actors_list')
+
+
+def _encode_strings(values):
+    """NUL-separated UTF-8 plus byte offsets of each value (separator excluded)"""
+    valid = np.array([isinstance(v, str) for v in values], dtype=bool)
+    encoded = [v.replace('\x00', '').encode() if ok else b'' for v, ok in zip(values, valid)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) + 1 for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b'\x00'.join(encoded) + b'\x00', dtype=np.uint8)
+    return offsets, data, valid
+
+
+def _decode_strings(offsets, data, valid):
+    values = data.tobytes().decode().split('\x00')[:len(offsets) - 1]
+    values = np.fromiter(values, dtype=object, count=len(values))
+    values[~np.asarray(valid)] = None
+    return values
+
+
+def _encode_lists(lists):
+    vocab = {}
+    values = [vocab.setdefault(item, len(vocab)) for items in lists for item in items]
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in lists], out=offsets[1:])
+    return offsets, np.asarray(values, dtype=np.int32), list(vocab)
+
+
+def _write_vocab(out_dir, name, vocab):
+    offsets, data, valid = _encode_strings(vocab)
+    np.save(os.path.join(out_dir, f'{name}.vocab.offsets.npy'), offsets)
+    np.save(os.path.join(out_dir, f'{name}.vocab.data.npy'), data)
+
+
+def _read_vocab(path, name):
+    offsets = np.load(os.path.join(path, f'{name}.vocab.offsets.npy'))
+    data = np.load(os.path.join(path, f'{name}.vocab.data.npy'))
+    return _decode_strings(offsets, data, np.ones(len(offsets) - 1, dtype=bool))
+
+
+def write_columnar(catalog, out_dir=COLUMNAR_CATALOG_PATH):
+    """Write a `Catalog` as a columnar directory, replacing any previous one"""
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    movies = catalog.movies
+    columns = {}
+
+    for name in movies.columns:
+        if name in SOURCE_LIST_COLUMNS:
+            continue
+        series = movies[name]
+        if name in CATEGORICAL_COLUMNS:
+            categorical = pd.Categorical(series)
+            np.save(os.path.join(tmp_dir, f'{name}.codes.npy'), categorical.codes.astype(np.int32))
+            _write_vocab(tmp_dir, name, [str(c) for c in categorical.categories])
+            columns[name] = 'categorical'
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), series.to_numpy())
+            columns[name] = 'array'
+        else:
+            offsets, data, valid = _encode_strings(series.tolist())
+            np.save(os.path.join(tmp_dir, f'{name}.offsets.npy'), offsets)
+            np.save(os.path.join(tmp_dir, f'{name}.data.npy'), data)
+            np.save(os.path.join(tmp_dir, f'{name}.valid.npy'), valid)
+            columns[name] = 'string'
+
+    for name, lists in (('genres', catalog.genre_lists), ('actors', catalog.actor_lists)):
+        offsets, values, vocab = _encode_lists(lists)
+        np.save(os.path.join(tmp_dir, f'{name}.offsets.npy'), offsets)
+        np.save(os.path.join(tmp_dir, f'{name}.values.npy'), values)
+        _write_vocab(tmp_dir, name, vocab)
+
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+        json.dump({'format': FORMAT_VERSION, 'rows': len(movies), 'columns': columns}, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+
+
+def read_columnar(path=COLUMNAR_CATALOG_PATH):
+    """Load a columnar catalog; returns (movies frame, list codes) for `Catalog`"""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest['format'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported catalog format {manifest['format']} in {path}")
+
+    def load(name):
+        return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+    data = {}
+    for name, kind in manifest['columns'].items():
+        if kind == 'array':
+            data[name] = load(name)
+        elif kind == 'categorical':
+            data[name] = pd.Categorical.from_codes(np.asarray(load(f'{name}.codes')),
+                                                   categories=_read_vocab(path, name))
+        else:
+            data[name] = _decode_strings(load(f'{name}.offsets'), load(f'{name}.data'), load(f'{name}.valid'))
+
+    codes = {name: (load(f'{name}.offsets'), load(f'{name}.values'), _read_vocab(path, name))
+             for name in LIST_COLUMNS}
+    return pd.DataFrame(data, copy=False), codes
+
+
+if __name__ == '__main__':
+    import sys
+    from catalog import CATALOG_PATH, load_catalog
+
+    source = sys.argv[1] if len(sys.argv) > 1 else CATALOG_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else COLUMNAR_CATALOG_PATH
+    write_columnar(load_catalog(source), target)
+    print(f"Wrote {target}")
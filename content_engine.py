@@ -0,0 +1,250 @@
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from catalog import get_catalog
+
+DIRECTOR_WEIGHT = 0.3
+ACTOR_WEIGHT = 0.35
+GENRE_WEIGHT = 0.25
+QUALITY_WEIGHT = 0.1
+ACTOR_SATURATION = 3
+# Past this share of the catalog, merging posting lists costs more than scoring every row
+DENSE_REACH_FRACTION = 0.05
+GENRE_REACH = 200   # best-rated movies, overall and per liked genre, added to a profile's reach
+
+_lock = threading.Lock()
+_cached = None
+
+
+def _multi_hot(offsets, values, n_terms):
+    """CSR matrix with a 1 wherever row i contains vocabulary term j"""
+    data = np.ones(len(values), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, np.array(values), np.array(offsets)),
+                               shape=(len(offsets) - 1, n_terms))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1.0
+    return matrix
+
+
+def _postings(matrix):
+    """(offsets, rows) posting lists of a multi-hot matrix: the sorted row
+    positions containing term j are rows[offsets[j]:offsets[j + 1]]
+    """
+    csc = matrix.tocsc()
+    csc.sort_indices()
+    return csc.indptr.astype(np.int64), csc.indices.astype(np.int32)
+
+
+def _code_postings(codes, n_terms):
+    """Posting lists of a single-valued coded column; -1 codes are left out"""
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[order], minlength=n_terms), out=offsets[1:])
+    return offsets, order.astype(np.int32)
+
+
+def _ranked_postings(postings, quality):
+    """Posting lists reordered best quality first within each term"""
+    offsets, rows = postings
+    terms = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return offsets, rows[np.lexsort((-quality[rows], terms))]
+
+
+def _overlap(lists):
+    """Sorted union of posting lists and how many of the lists each position is in"""
+    if not lists:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    merged = np.sort(np.concatenate(lists))
+    starts = np.flatnonzero(np.r_[True, merged[1:] != merged[:-1]])
+    return merged[starts], np.diff(np.r_[starts, len(merged)])
+
+
+def _encode(lists):
+    """Offsets, vocabulary codes and vocabulary of a tuple-of-lists column"""
+    vocab = _vocabulary(lists)
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(items) for items in lists), dtype=np.int64, count=len(lists)), out=offsets[1:])
+    values = np.fromiter((vocab[item] for items in lists for item in items),
+                         dtype=np.int32, count=int(offsets[-1]))
+    return offsets, values, vocab
+
+
+def _vocabulary(lists):
+    vocab = {}
+    for items in lists:
+        for item in items:
+            if item not in vocab:
+                vocab[item] = len(vocab)
+    return vocab
+
+
+class ContentEngine:
+    """Multi-hot genre/actor/director matrices for scoring the whole catalog at
+    once, plus inverted posting lists (name -> sorted row positions) for scoring
+    only the movies a profile can reach.
+    """
+
+    def __init__(self, catalog):
+        movies = catalog.movies
+        self.catalog = catalog
+
+        if catalog.codes is not None:
+            genre_offsets, genre_values, genre_vocab = catalog.codes['genres']
+            actor_offsets, actor_values, actor_vocab = catalog.codes['actors']
+            self.genre_vocab = {name: i for i, name in enumerate(genre_vocab)}
+            self.actor_vocab = {name: i for i, name in enumerate(actor_vocab)}
+        else:
+            genre_offsets, genre_values, self.genre_vocab = _encode(catalog.genre_lists)
+            actor_offsets, actor_values, self.actor_vocab = _encode(catalog.actor_lists)
+        self.genres = _multi_hot(genre_offsets, genre_values, len(self.genre_vocab))
+        self.actors = _multi_hot(actor_offsets, actor_values, len(self.actor_vocab))
+
+        # "Unknown" is dropped before numbering so codes stay dense (0..len(vocab) - 1)
+        directors = movies['director']
+        if isinstance(directors.dtype, pd.CategoricalDtype):
+            if "Unknown" in directors.cat.categories:
+                directors = directors.cat.remove_categories("Unknown")
+            self.director_vocab = {d: i for i, d in enumerate(directors.cat.categories)}
+            codes = directors.cat.codes.to_numpy(dtype=np.int32, copy=True)
+        else:
+            known = directors.notna() & (directors != "Unknown")
+            self.director_vocab = {d: i for i, d in enumerate(directors[known].unique())}
+            codes = np.full(len(movies), -1, dtype=np.int32)
+            codes[known.to_numpy()] = [self.director_vocab[d] for d in directors[known]]
+        self.director_codes = codes
+
+        self.postings = {
+            'director': _code_postings(codes, len(self.director_vocab) + 1),
+            'actor': _postings(self.actors),
+            'genre': _postings(self.genres),
+        }
+        self.vocabs = {'director': self.director_vocab, 'actor': self.actor_vocab, 'genre': self.genre_vocab}
+
+        self.quality = np.nan_to_num(movies['vote_average'].to_numpy(dtype=np.float64), nan=0.0)
+        self.genre_by_quality = _ranked_postings(self.postings['genre'], self.quality)
+        self.by_quality = np.argsort(-self.quality, kind='stable')
+        self.max_genres = int(np.diff(self.genres.indptr).max(initial=0))
+
+    def _indicator(self, names, vocab):
+        vec = np.zeros(len(vocab), dtype=np.float32)
+        hits = [vocab[n] for n in names if n in vocab]
+        vec[hits] = 1.0
+        return vec
+
+    def score(self, directors, actors, genres, positions=None):
+        """Content score for a director/actor/genre profile, for every catalog
+        row or only the given row positions.
+        """
+        if positions is None:
+            quality, director_codes, actor_rows, genre_rows = self.quality, self.director_codes, self.actors, self.genres
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            quality, director_codes = self.quality[positions], self.director_codes[positions]
+            actor_rows, genre_rows = self.actors[positions], self.genres[positions]
+
+        scores = QUALITY_WEIGHT * quality
+
+        director_vec = np.append(self._indicator(directors, self.director_vocab), 0.0)
+        scores = scores + DIRECTOR_WEIGHT * director_vec[director_codes]
+
+        if actors:
+            overlap = np.asarray(actor_rows @ self._indicator(actors, self.actor_vocab), dtype=np.float64)
+            scores += ACTOR_WEIGHT * np.minimum(overlap / ACTOR_SATURATION, 1.0)
+
+        if genres:
+            overlap = np.asarray(genre_rows @ self._indicator(genres, self.genre_vocab), dtype=np.float64)
+            scores += GENRE_WEIGHT * overlap / len(genres)
+
+        return scores
+
+    def posting_lists(self, kind, names):
+        """Sorted row positions of the movies with each known director/actor/genre name"""
+        offsets, rows = self.postings[kind]
+        vocab = self.vocabs[kind]
+        terms = [vocab[n] for n in names if n in vocab]
+        return [rows[offsets[t]:offsets[t + 1]] for t in terms]
+
+    def score_reach(self, directors, actors, genres):
+        """(positions, scores, bound) for the movies sharing a director or actor
+        with the profile, plus the GENRE_REACH best-rated movies overall and of
+        each liked genre.
+
+        Candidates come from merging the profile's director and actor posting
+        lists, so the cost follows the profile's reach rather than the catalog
+        size; genres are too broad to enumerate and only add their bounded,
+        quality-ordered lists. Genre overlap is then counted for the candidates
+        alone. Scores equal `score` at those positions, and no movie left out
+        scores above `bound`, so a top-k whose last score beats it is the dense
+        top-k. Profiles whose director and actor lists cover more than
+        DENSE_REACH_FRACTION of the catalog are scored densely over every row.
+        """
+        n = len(self.quality)
+        director_lists = self.posting_lists('director', directors)
+        actor_lists = self.posting_lists('actor', actors)
+        if sum(len(rows) for rows in director_lists + actor_lists) > DENSE_REACH_FRACTION * n:
+            return np.arange(n), self.score(directors, actors, genres), -np.inf
+
+        director_rows, _ = _overlap(director_lists)
+        actor_rows, actor_counts = _overlap(actor_lists)
+        offsets, rows = self.genre_by_quality
+        genre_terms = [self.genre_vocab[g] for g in genres if g in self.genre_vocab]
+        reach = [director_rows, actor_rows, self.by_quality[:GENRE_REACH]]
+        reach += [rows[offsets[t]:min(offsets[t] + GENRE_REACH, offsets[t + 1])] for t in genre_terms]
+        positions = np.unique(np.concatenate(reach)).astype(np.int64)
+
+        # A movie left out matches no director or actor, and is rated no higher than
+        # the last movie taken from the overall list or from any liked genre it is in
+        bound = QUALITY_WEIGHT * self.quality[self.by_quality[GENRE_REACH - 1]] if n > GENRE_REACH else -np.inf
+        cuts = [self.quality[rows[offsets[t] + GENRE_REACH - 1]] for t in genre_terms
+                if offsets[t + 1] - offsets[t] > GENRE_REACH]
+        if cuts:
+            overlap = min(len(genre_terms), self.max_genres) / len(genres)
+            bound = max(bound, QUALITY_WEIGHT * max(cuts) + GENRE_WEIGHT * overlap)
+
+        scores = QUALITY_WEIGHT * self.quality[positions]
+
+        director_hit = np.zeros(len(positions))
+        director_hit[np.searchsorted(positions, director_rows)] = 1.0
+        scores = scores + DIRECTOR_WEIGHT * director_hit
+
+        if actors:
+            overlap = np.zeros(len(positions))
+            overlap[np.searchsorted(positions, actor_rows)] = actor_counts
+            scores += ACTOR_WEIGHT * np.minimum(overlap / ACTOR_SATURATION, 1.0)
+
+        if genres:
+            overlap = np.asarray(self.genres[positions] @ self._indicator(genres, self.genre_vocab), dtype=np.float64)
+            scores += GENRE_WEIGHT * overlap / len(genres)
+
+        return positions, scores, bound
+
+    def top_k(self, scores, k, exclude=()):
+        """Positions of the k best scores, best first, skipping excluded positions;
+        ties go to the lowest position, including ties at the cut.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        if len(exclude):
+            scores = scores.copy()
+            scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+        k = min(k, int(np.count_nonzero(scores > -np.inf)))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        cut = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > cut)
+        top = np.concatenate([above, np.flatnonzero(scores == cut)[:k - len(above)]])
+        return top[np.lexsort((top, -scores[top]))]
+
+
+def get_content_engine():
+    """Engine for the current catalog, rebuilt when the catalog reloads"""
+    global _cached
+    catalog = get_catalog()
+    cached = _cached
+    if cached is not None and cached.catalog is catalog:
+        return cached
+    with _lock:
+        if _cached is None or _cached.catalog is not catalog:
+            _cached = ContentEngine(catalog)
+        return _cached
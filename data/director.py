@@ -25,7 +25,6 @@ TOP_DIRECTORS = [
     "David Fincher",
     "Spike Lee",
     "Yorgos Lanthimos",
-    "Denis Villeneuve",
     "Jane Campion",
     "Patty Jenkins",
     "Ryan Coogler",
@@ -1,23 +1,34 @@
+import atexit
+import calendar
 import sqlite3
 import hashlib
+import threading
+import time
+from collections import Counter
+import numpy as np
 import pandas as pd
+import llm_cache
+from catalog import get_catalog
+from db_pool import get_pool
+from metrics import count, span, timed
+from model_registry import get_model
 
 DB_PATH = "database/users.db"
+FLUSH_INTERVAL = 0.5
+FLUSH_SIZE = 256
+MAX_RATING = 5
+EMBEDDING_HALF_LIFE_DAYS = 180   # None turns off time decay of older ratings
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+# Each entry upgrades the schema by one version; PRAGMA user_version records
+# how many have been applied, so existing databases only run the new ones.
+MIGRATIONS = [
+    """
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE,
             password_hash TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cursor.execute("""
+        );
         CREATE TABLE IF NOT EXISTS user_ratings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
@@ -25,70 +36,479 @@ def init_db():
             rating INTEGER,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+        );
+    """,
+    """
+        CREATE INDEX IF NOT EXISTS idx_user_ratings_user_movie
+            ON user_ratings (user_id, movie_id);
+    """,
+    """
+        DELETE FROM user_ratings WHERE id NOT IN (
+            SELECT MAX(id) FROM user_ratings GROUP BY user_id, movie_id
+        );
+        DROP INDEX IF EXISTS idx_user_ratings_user_movie;
+        CREATE UNIQUE INDEX idx_user_ratings_user_movie
+            ON user_ratings (user_id, movie_id);
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS user_taste_counts (
+            user_id INTEGER,
+            kind TEXT,
+            name TEXT,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, kind, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS user_taste_built (
+            user_id INTEGER PRIMARY KEY
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS user_embeddings (
+            user_id INTEGER PRIMARY KEY,
+            model_version TEXT NOT NULL,
+            total_weight REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            weighted_sum BLOB NOT NULL
+        );
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS user_recommendations (
+            user_id INTEGER,
+            kind TEXT,
+            source_version TEXT NOT NULL,
+            computed_at REAL NOT NULL,
+            movie_ids BLOB NOT NULL,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID;
+    """,
+    """
+        DELETE FROM user_taste_built;
+    """,
+    """
+        ALTER TABLE user_taste_built ADD COLUMN catalog_version TEXT;
+    """,
+]
+
+UPSERT_RATING = """
+    INSERT INTO user_ratings (user_id, movie_id, rating, timestamp)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, movie_id)
+    DO UPDATE SET rating = excluded.rating, timestamp = excluded.timestamp
+"""
+
+ADD_TASTE_COUNT = """
+    INSERT INTO user_taste_counts (user_id, kind, name, count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, kind, name)
+    DO UPDATE SET count = count + excluded.count
+"""
+
+UPSERT_EMBEDDING = """
+    INSERT INTO user_embeddings (user_id, model_version, total_weight, updated_at, weighted_sum)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        model_version = excluded.model_version, total_weight = excluded.total_weight,
+        updated_at = excluded.updated_at, weighted_sum = excluded.weighted_sum
+"""
+
+UPSERT_RECOMMENDATIONS = """
+    INSERT INTO user_recommendations (user_id, kind, source_version, computed_at, movie_ids)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, kind) DO UPDATE SET
+        source_version = excluded.source_version, computed_at = excluded.computed_at,
+        movie_ids = excluded.movie_ids
+"""
+
+def connection():
+    return get_pool(DB_PATH).connection()
+
+def init_db():
+    with connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f"BEGIN; {migration} PRAGMA user_version = {number}; COMMIT;")
+        conn.execute("PRAGMA optimize")
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def register_user(username, password):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                      (username, hash_password(password)))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                         (username, hash_password(password)))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 def authenticate_user(username, password):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users WHERE username = ? AND password_hash = ?",
-                  (username, hash_password(password)))
-    result = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        result = conn.execute("SELECT user_id FROM users WHERE username = ? AND password_hash = ?",
+                              (username, hash_password(password))).fetchone()
     return result[0] if result else None
 
 
 
+class RatingBuffer:
+    """Write-behind buffer for ratings.
+
+    Rapid changes to the same (user, movie) pair collapse into one pending row;
+    pending rows are upserted in a single transaction once FLUSH_SIZE pairs are
+    waiting or FLUSH_INTERVAL seconds after the first one arrived. Writes are
+    only visible to this process until they are flushed; a batch being
+    written stays readable in `_in_flight` until its transaction commits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._in_flight = {}
+        self._timer = None
+
+    def add(self, user_id, movie_id, rating):
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with self._lock:
+            self._pending[(user_id, movie_id)] = (rating, stamp)
+            full = len(self._pending) >= FLUSH_SIZE
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def _schedule(self):
+        """Start the flush timer unless one is running; call with `_lock` held"""
+        if self._timer is None:
+            self._timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending_rating(self, user_id, movie_id):
+        with self._lock:
+            value = self._pending.get((user_id, movie_id)) or self._in_flight.get((user_id, movie_id))
+        return None if value is None else value[0]
+
+    def pending_for(self, user_id):
+        """Buffered or still-uncommitted {movie_id: (rating, timestamp)} for one user"""
+        with self._lock:
+            pending = {m: value for (u, m), value in self._in_flight.items() if u == user_id}
+            pending.update((m, value) for (u, m), value in self._pending.items() if u == user_id)
+            return pending
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._in_flight = batch
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not batch:
+                return
+            rows = [(u, m, rating, stamp) for (u, m), (rating, stamp) in batch.items()]
+            # Load these before taking the write lock; ratings are saved even if either is unavailable
+            catalog, model = _load_or_none(get_catalog), _load_or_none(get_model)
+            try:
+                with span('db.flush'), connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    previous = {}
+                    for pair in batch:
+                        row = conn.execute("SELECT rating, timestamp FROM user_ratings WHERE user_id = ? AND movie_id = ?",
+                                           pair).fetchone()
+                        if row is not None:
+                            previous[pair] = row
+                    conn.executemany(UPSERT_RATING, rows)
+                    _add_taste_counts(conn, catalog, [pair for pair in batch if pair not in previous])
+                    _update_user_embeddings(conn, model, batch, previous)
+                    conn.commit()
+                with self._lock:
+                    self._in_flight = {}
+                count('db.ratings_flushed', len(rows))
+            except Exception as e:
+                count('db.flush_errors')
+                if 'database is locked' in str(e):
+                    count('db.flush_locked')
+                print(f"Error saving ratings: {e}")
+                with self._lock:
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._in_flight = {}
+                    self._schedule()
+
+def _load_or_none(load):
+    try:
+        return load()
+    except Exception as e:
+        print(f"Error loading {load.__name__}: {e}")
+        return None
+
+def _add_taste_counts(conn, catalog, new_pairs):
+    """Fold newly rated movies into their users' stored taste counts; without
+    a catalog the users are marked for a rebuild on next read instead. Users
+    whose counts were built against another catalog version are left alone:
+    they are rebuilt on next read anyway.
+    """
+    by_user = {}
+    for user_id, movie_id in new_pairs:
+        by_user.setdefault(user_id, []).append(movie_id)
+    if catalog is None:
+        conn.executemany("DELETE FROM user_taste_built WHERE user_id = ?", [(u,) for u in by_user])
+        return
+    for user_id, movie_ids in by_user.items():
+        if _taste_built_version(conn, user_id) != str(catalog.version):
+            continue
+        conn.executemany(ADD_TASTE_COUNT, [
+            (user_id, kind, name, count)
+            for (kind, name), count in catalog.taste_counts(movie_ids).items()
+        ])
+
+def _rebuild_taste_profile(conn, user_id, catalog):
+    count('db.taste_rebuilds')
+    conn.execute("BEGIN IMMEDIATE")
+    movie_ids = [row[0] for row in conn.execute("SELECT movie_id FROM user_ratings WHERE user_id = ?", (user_id,))]
+    conn.execute("DELETE FROM user_taste_counts WHERE user_id = ?", (user_id,))
+    conn.execute("INSERT OR REPLACE INTO user_taste_built (user_id, catalog_version) VALUES (?, ?)",
+                 (user_id, str(catalog.version)))
+    _add_taste_counts(conn, catalog, [(user_id, movie_id) for movie_id in movie_ids])
+    conn.commit()
+
+def _taste_built_version(conn, user_id):
+    """Catalog version the user's taste counts were built against, or None if they need a rebuild"""
+    row = conn.execute("SELECT catalog_version FROM user_taste_built WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row is not None else None
+
+def _decay(age_seconds):
+    if EMBEDDING_HALF_LIFE_DAYS is None:
+        return 1.0
+    return 0.5 ** (age_seconds / (EMBEDDING_HALF_LIFE_DAYS * 86400))
+
+def _rating_weight(rating, stamp, now):
+    """Weight of one rating in the user embedding: rating strength, halved
+    every EMBEDDING_HALF_LIFE_DAYS since it was given.
+    """
+    return rating / MAX_RATING * _decay(now - calendar.timegm(time.strptime(stamp, '%Y-%m-%d %H:%M:%S')))
+
+def _update_user_embeddings(conn, model, batch, previous):
+    """Fold flushed ratings into stored user embeddings in O(d) per rating.
+
+    Rows hold the weight and weighted embedding sum as of `updated_at`; both
+    decay by the same factor, so they are rescaled to now before the change
+    is applied. A re-rated movie first has its old contribution removed.
+    Users without a row for the current model are rebuilt on next read; so
+    are all of the batch's users when no model could be loaded.
+    """
+    by_user = {}
+    for (user_id, movie_id), (rating, stamp) in batch.items():
+        by_user.setdefault(user_id, []).append((movie_id, rating, stamp))
+    stored = {}
+    for user_id in by_user:
+        row = _embedding_row(conn, user_id)
+        if row is not None:
+            stored[user_id] = row
+    if not stored:
+        return
+    if model is None:
+        conn.executemany("DELETE FROM user_embeddings WHERE user_id = ?", [(u,) for u in stored])
+        return
+    now = time.time()
+    for user_id, row in stored.items():
+        if row[0] != str(model.version):
+            continue
+        changes = by_user[user_id]
+        old = {movie_id: previous[(user_id, movie_id)] for movie_id, _, _ in changes if (user_id, movie_id) in previous}
+        total, weighted_sum = _apply_ratings(model, row, changes, old, now)
+        conn.execute(UPSERT_EMBEDDING, (user_id, row[0], total, now, weighted_sum.tobytes()))
+
+def _apply_ratings(model, row, changes, previous, now):
+    """(total_weight, weighted_sum) of a stored embedding row decayed to `now`
+    with (movie_id, rating, timestamp) `changes` applied; `previous` maps
+    re-rated movie ids to their stored (rating, timestamp).
+    """
+    decay = _decay(now - row[2])
+    total = row[1] * decay
+    weighted_sum = np.frombuffer(row[3], dtype=np.float64) * decay
+    items = model.lookup([movie_id for movie_id, _, _ in changes])
+    for (movie_id, rating, stamp), item in zip(changes, items):
+        if item < 0:
+            continue
+        embedding = np.asarray(model.item_embeddings[item], dtype=np.float64)
+        if movie_id in previous:
+            weight = _rating_weight(*previous[movie_id], now)
+            total -= weight
+            weighted_sum -= weight * embedding
+        weight = _rating_weight(rating, stamp, now)
+        total += weight
+        weighted_sum += weight * embedding
+    return total, weighted_sum
+
+def _rebuild_user_embedding(conn, user_id, model):
+    count('db.embedding_rebuilds')
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute("SELECT movie_id, rating, timestamp FROM user_ratings WHERE user_id = ?", (user_id,)).fetchall()
+    now = time.time()
+    items = model.lookup([movie_id for movie_id, _, _ in rows])
+    known = items >= 0
+    weights = np.array([_rating_weight(rating, stamp, now) for _, rating, stamp in rows], dtype=np.float64)[known]
+    embeddings = np.asarray(model.item_embeddings[items[known]], dtype=np.float64)
+    weighted_sum = weights @ embeddings if len(weights) else np.zeros(model.item_embeddings.shape[1])
+    row = (str(model.version), float(weights.sum()), now, weighted_sum.tobytes())
+    conn.execute(UPSERT_EMBEDDING, (user_id, *row))
+    conn.commit()
+    return row
+
+_rating_buffer = RatingBuffer()
+atexit.register(_rating_buffer.flush)
+
+@timed('db.get_rating')
+def get_rating(user_id, movie_id):
+    rating = _rating_buffer.pending_rating(user_id, movie_id)
+    if rating is not None:
+        return rating
+    with connection() as conn:
+        row = conn.execute("SELECT rating FROM user_ratings WHERE user_id = ? AND movie_id = ?",
+                           (user_id, movie_id)).fetchone()
+    return row[0] if row else None
+
+@timed('db.save_rating')
 def save_rating(user_id, movie_id, rating):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    """Buffer a rating; returns False when the user already had this exact rating"""
     if user_id is None:
         raise ValueError("User ID cannot be None when saving a rating.")
     
-    try:
-        cursor.execute("""
-            INSERT INTO user_ratings (user_id, movie_id, rating)
-            VALUES (?, ?, ?)
-        """, (user_id, movie_id, rating))
-        conn.commit()
-    except Exception as e:
-        print(f"Error saving rating: {e}")
-    finally:
-        conn.close()
+    if get_rating(user_id, movie_id) == rating:
+        return False
+    _rating_buffer.add(user_id, movie_id, rating)
+    llm_cache.invalidate_user(user_id)
+    return True
+
+def flush_ratings():
+    _rating_buffer.flush()
 
+@timed('db.get_user_ratings')
 def get_user_ratings(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT movie_id, rating, timestamp FROM user_ratings WHERE user_id = ?", 
-                          conn, params=(user_id,))
-    conn.close()
+    pending = _rating_buffer.pending_for(user_id)
+    with connection() as conn:
+        df = pd.read_sql_query("SELECT movie_id, rating, timestamp FROM user_ratings WHERE user_id = ?", 
+                               conn, params=(user_id,))
+    if pending:
+        buffered = pd.DataFrame(
+            [(m, rating, stamp) for m, (rating, stamp) in pending.items()],
+            columns=['movie_id', 'rating', 'timestamp']
+        )
+        df = pd.concat([df[~df['movie_id'].isin(pending.keys())], buffered], ignore_index=True)
     return df
 
+@timed('db.get_rating_count')
 def get_rating_count(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM user_ratings WHERE user_id = ?", (user_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
+    pending = list(_rating_buffer.pending_for(user_id))
+    with connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM user_ratings WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if pending:
+            placeholders = ','.join('?' * len(pending))
+            stored = conn.execute(f"SELECT COUNT(*) FROM user_ratings WHERE user_id = ? AND movie_id IN ({placeholders})",
+                                  (user_id, *pending)).fetchone()[0]
+            count += len(pending) - stored
     return count
 
-init_db()
\ No newline at end of file
+@timed('db.get_taste_profile')
+def get_taste_profile(user_id):
+    """Counter of (kind, name) -> number of the user's rated movies with that director/actor/genre.
+
+    Counts are maintained incrementally as ratings are flushed; users rated
+    before the table existed, or whose counts predate the current catalog, are
+    rebuilt on read. Buffered ratings of movies not yet stored are counted on
+    top, without forcing a flush.
+    """
+    pending = list(_rating_buffer.pending_for(user_id))
+    catalog = get_catalog()
+    with connection() as conn:
+        if _taste_built_version(conn, user_id) != str(catalog.version):
+            _rebuild_taste_profile(conn, user_id, catalog)
+        # One read transaction, so a flush committing meanwhile is seen by both queries or neither
+        conn.execute("BEGIN")
+        rows = conn.execute("SELECT kind, name, count FROM user_taste_counts WHERE user_id = ?",
+                            (user_id,)).fetchall()
+        stored = _stored_ratings(conn, user_id, pending)
+        conn.commit()
+    taste = Counter({(kind, name): count for kind, name, count in rows})
+    new = [movie_id for movie_id in pending if movie_id not in stored]
+    if new:
+        taste.update(catalog.taste_counts(new))
+    return taste
+
+def _stored_ratings(conn, user_id, movie_ids):
+    """{movie_id: (rating, timestamp)} of the given movies already in user_ratings"""
+    if not movie_ids:
+        return {}
+    placeholders = ','.join('?' * len(movie_ids))
+    rows = conn.execute(f"SELECT movie_id, rating, timestamp FROM user_ratings WHERE user_id = ? "
+                        f"AND movie_id IN ({placeholders})", (user_id, *movie_ids)).fetchall()
+    return {movie_id: (rating, stamp) for movie_id, rating, stamp in rows}
+
+@timed('db.get_stored_recommendations')
+def get_stored_recommendations(user_id, kind):
+    """(source_version, movie_ids) of a stored recommendation list, or None"""
+    with connection() as conn:
+        row = conn.execute("SELECT source_version, movie_ids FROM user_recommendations WHERE user_id = ? AND kind = ?",
+                           (user_id, kind)).fetchone()
+    if row is None:
+        return None
+    return row[0], np.frombuffer(row[1], dtype=np.int64).tolist()
+
+@timed('db.store_recommendations')
+def store_recommendations(rows):
+    """Save (user_id, kind, source_version, movie_ids) lists in one transaction"""
+    now = time.time()
+    with connection() as conn:
+        conn.executemany(UPSERT_RECOMMENDATIONS, [
+            (user_id, kind, version, now, np.asarray(movie_ids, dtype=np.int64).tobytes())
+            for user_id, kind, version, movie_ids in rows
+        ])
+        conn.commit()
+
+def iter_rated_user_ids(chunk_size):
+    """Ids of every user with at least one stored rating, in chunks"""
+    last = -1
+    while True:
+        with connection() as conn:
+            chunk = [row[0] for row in conn.execute(
+                "SELECT DISTINCT user_id FROM user_ratings WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last, chunk_size))]
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+@timed('db.get_user_embedding')
+def get_user_embedding(user_id):
+    """Rating-weighted, time-decayed mean NCF embedding of the user's rated
+    movies, or None when the model knows none of them.
+
+    Kept up to date as ratings are flushed; built from the full history on
+    first read and whenever a new model version is published. Buffered
+    ratings are applied on top, without forcing a flush.
+    """
+    pending = _rating_buffer.pending_for(user_id)
+    model = get_model()
+    with connection() as conn:
+        row = _embedding_row(conn, user_id)
+        if row is None or row[0] != str(model.version):
+            _rebuild_user_embedding(conn, user_id, model)
+        # One read transaction: a flush committing meanwhile updates the row and the
+        # ratings together, and re-applying a rating that is already stored cancels out.
+        conn.execute("BEGIN")
+        row = _embedding_row(conn, user_id)
+        previous = _stored_ratings(conn, user_id, list(pending))
+        conn.commit()
+    changes = [(movie_id, rating, stamp) for movie_id, (rating, stamp) in pending.items()]
+    total, weighted_sum = _apply_ratings(model, row, changes, previous, time.time())
+    if total <= 1e-9:
+        return None
+    return (weighted_sum / total).astype(np.float32)
+
+def _embedding_row(conn, user_id):
+    return conn.execute("SELECT model_version, total_weight, updated_at, weighted_sum FROM user_embeddings "
+                        "WHERE user_id = ?", (user_id,)).fetchone()
+
+init_db()
@@ -0,0 +1,87 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+POOL_SIZE = 8
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Thread-safe pool of tuned SQLite connections to one database file.
+
+    A connection is only ever used by one thread at a time; it is handed
+    back to the pool when the `connection()` block exits.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def get_pool(path):
+    """Shared pool for `path`, created on first use"""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def close_pools():
+    """Close the idle connections of every pool, e.g. before forking workers:
+    SQLite connections must not be carried across a fork.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+def reset_pools():
+    """Drop pools inherited from a parent process; call first thing in a forked
+    worker so it opens its own connections instead of sharing the parent's.
+    """
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
@@ -0,0 +1,58 @@
+import numpy as np
+
+MMR_LAMBDA = 0.7
+MAX_PER_GROUP = 2
+
+
+def _unit_rows(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+
+def mmr(relevance, embeddings, k, lam=MMR_LAMBDA, groups=None, max_per_group=MAX_PER_GROUP):
+    """Maximal Marginal Relevance order of up to k candidates, as indices into
+    the inputs.
+
+    Each pick maximizes lam * relevance - (1 - lam) * max cosine similarity to
+    the picks so far; the running max is updated with one matrix-vector product
+    per pick. `groups` (ints, negative = no group) caps how many picks share a
+    group, e.g. a director. When the caps leave too few candidates they are
+    lifted so k results are still returned.
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    span = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / span if span > 0 else np.zeros(n)
+    unit = _unit_rows(embeddings)
+
+    max_sim = np.zeros(n)
+    selected = np.zeros(n, dtype=bool)
+    allowed = np.ones(n, dtype=bool)
+    if groups is not None:
+        groups = np.asarray(groups, dtype=np.int64)
+        grouped = groups >= 0
+        group_ids, group_codes = np.unique(groups[grouped], return_inverse=True)
+        codes = np.full(n, -1, dtype=np.int64)
+        codes[grouped] = group_codes
+        group_counts = np.zeros(len(group_ids), dtype=np.int64)
+
+    picks = []
+    for _ in range(k):
+        candidates = allowed & ~selected
+        if not candidates.any():
+            candidates = ~selected
+        gain = np.where(candidates, lam * relevance - (1 - lam) * max_sim, -np.inf)
+        pick = int(np.argmax(gain))
+        picks.append(pick)
+        selected[pick] = True
+        np.maximum(max_sim, unit @ unit[pick], out=max_sim)
+        if groups is not None and codes[pick] >= 0:
+            group_counts[codes[pick]] += 1
+            if group_counts[codes[pick]] >= max_per_group:
+                allowed[codes == codes[pick]] = False
+    return np.asarray(picks, dtype=np.int64)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+import time
+import metrics
+from db_pool import get_pool
+
+CACHE_PATH = "database/llm_cache.db"
+TTL_SECONDS = 7 * 24 * 3600
+MAX_ENTRIES = 20_000
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+
+def _connection():
+    return get_pool(CACHE_PATH).connection()
+
+
+def init_cache():
+    with _connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                user_id INTEGER,
+                kind TEXT,
+                value TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_user ON llm_cache (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        conn.commit()
+
+
+def _normalize(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def fingerprint(kind, model_name, *parts):
+    """Stable hash of everything an LLM output depends on"""
+    payload = json.dumps([kind, model_name, _normalize(list(parts))], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+    metrics.count(f'llm_cache.{name}', n)
+
+
+def get(key, ttl=TTL_SECONDS):
+    """Cached value for `key`, or None when missing or older than `ttl` seconds"""
+    now = time.time()
+    with _connection() as conn:
+        row = conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > ttl:
+            _count('misses')
+            return None
+        conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+    _count('hits')
+    return row[0]
+
+
+def put(key, value, kind, user_id=None, max_entries=MAX_ENTRIES):
+    """Store `value` and evict least recently used entries beyond `max_entries`"""
+    now = time.time()
+    with _connection() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO llm_cache (key, user_id, kind, value, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, user_id, kind, value, now, now))
+        evicted = conn.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+        conn.commit()
+    _count('writes')
+    if evicted:
+        _count('evictions', evicted)
+
+
+def invalidate_user(user_id):
+    """Drop every cached output derived from this user's profile"""
+    with _connection() as conn:
+        conn.execute("DELETE FROM llm_cache WHERE user_id = ?", (user_id,))
+        conn.commit()
+
+
+def cached_call(kind, key, user_id, compute, ttl=TTL_SECONDS):
+    """Return the cached output for `key`, otherwise run `compute()` and store it"""
+    value = get(key, ttl)
+    if value is None:
+        value = compute()
+        put(key, value, kind, user_id)
+    return value
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+init_cache()
@@ -0,0 +1,305 @@
+"""Lightweight timing spans and counters for the recommendation, rating-store
+and LLM paths.
+
+* `with span('name'):` / `@timed('name')` - wall time of one stage;
+* `count('name', n)` - monotonic counter;
+* `trace()` - collect the spans of one unit of work (a Streamlit rerun, a
+  benchmark call) for a breakdown table or a JSON trace.
+
+Process-wide aggregation is off until `enable()` (or MOVIEREEL_METRICS=1).
+With it off and no trace open, `span` returns a shared no-op and `timed`
+calls straight through, so instrumented code pays one flag check per call.
+
+Aggregates are exported as Prometheus text (`prometheus_text`,
+`write_prometheus` for a textfile collector, `serve` for a /metrics
+endpoint, or MOVIEREEL_METRICS_PORT); traces as Chrome trace-event JSON,
+which chrome://tracing and Perfetto open directly.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = 'moviereel'
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_enabled = False
+_lock = threading.Lock()
+_spans = {}      # name -> [count per bucket..., +Inf count, sum]
+_counters = {}
+_current = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def enable(flag=True):
+    """Turn process-wide aggregation on or off"""
+    global _enabled
+    _enabled = flag
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """Forget every aggregate collected so far"""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def observe(name, start, end):
+    """Record a stage that ran from `start` to `end` (perf_counter seconds)"""
+    if _enabled:
+        with _lock:
+            histogram = _spans.get(name)
+            if histogram is None:
+                histogram = _spans[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(BUCKETS, end - start)] += 1
+            histogram[-1] += end - start
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end)
+
+
+def count(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+    trace = _current.get()
+    if trace is not None:
+        trace.add_count(name, n)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """Context manager timing the enclosed block as stage `name`"""
+    if not _enabled and _current.get() is None:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator: time every call of the function as stage `name`"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled and _current.get() is None:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind(fn):
+    """Wrap `fn` so it records into the caller's trace when run on another
+    thread (pool workers and helper threads do not inherit it).
+    """
+    trace = _current.get()
+    if trace is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+#*****************************Traces*********************************************
+class Trace:
+    """Spans and counts recorded while the trace was open, from every thread it was bound to"""
+
+    def __init__(self, name='trace'):
+        self.name = name
+        self.started = time.perf_counter()
+        self.ended = None
+        self.events = []     # (name, start, end, thread id)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._token = None
+
+    def add(self, name, start, end):
+        with self._lock:
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def add_count(self, name, n):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def start(self):
+        self._token = _current.set(self)
+        return self
+
+    def stop(self):
+        self.ended = time.perf_counter()
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        return self
+
+    @property
+    def seconds(self):
+        return (self.ended or time.perf_counter()) - self.started
+
+    def breakdown(self):
+        """[{'stage', 'calls', 'seconds', 'share'}] in order of first start;
+        nested stages are listed on their own, so shares can add up past 1.
+        """
+        stages = {}
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event[1])
+        for name, start, end, _ in events:
+            stage = stages.setdefault(name, {'stage': name, 'calls': 0, 'seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += end - start
+        total = self.seconds
+        for stage in stages.values():
+            stage['share'] = stage['seconds'] / total if total > 0 else 0.0
+        return list(stages.values())
+
+    def to_json(self):
+        """Chrome trace-event format: one complete ('X') event per span, in microseconds"""
+        with self._lock:
+            events = list(self.events)
+            counts = dict(self.counts)
+        trace_events = [
+            {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+             'ts': (start - self.started) * 1e6, 'dur': (end - start) * 1e6}
+            for name, start, end, tid in events
+        ]
+        return json.dumps({'traceEvents': trace_events, 'otherData': {'name': self.name, 'counts': counts}})
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+
+def clear_trace():
+    """Detach the trace current in this context without stopping it, e.g. one
+    left open by a run that was cut short before it could call `stop`.
+    """
+    _current.set(None)
+
+
+@contextmanager
+def trace(name='trace'):
+    """Record every span inside the block into a new Trace"""
+    current = Trace(name).start()
+    try:
+        yield current
+    finally:
+        current.stop()
+
+
+#*****************************Export*********************************************
+def _metric_name(name):
+    return f"{PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def snapshot():
+    """Aggregates as plain data: {'spans': {name: {count, seconds, buckets}}, 'counters': {...}}"""
+    with _lock:
+        spans = {name: list(histogram) for name, histogram in _spans.items()}
+        counters = dict(_counters)
+    return {
+        'spans': {
+            name: {'count': sum(h[:-1]), 'seconds': h[-1],
+                   'buckets': dict(zip([*map(str, BUCKETS), '+Inf'], h[:-1]))}
+            for name, h in spans.items()
+        },
+        'counters': counters,
+    }
+
+
+def prometheus_text():
+    """Aggregates in the Prometheus text exposition format"""
+    data = snapshot()
+    lines = [f"# HELP {PREFIX}_span_seconds Wall time of instrumented stages",
+             f"# TYPE {PREFIX}_span_seconds histogram"]
+    for name, h in sorted(data['spans'].items()):
+        cumulative = 0
+        for bound, n in h['buckets'].items():
+            cumulative += n
+            lines.append(f'{PREFIX}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_span_seconds_sum{{span="{name}"}} {h["seconds"]}')
+        lines.append(f'{PREFIX}_span_seconds_count{{span="{name}"}} {h["count"]}')
+    for name, value in sorted(data['counters'].items()):
+        metric = _metric_name(name) + '_total'
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Atomically write the aggregates to `path` (e.g. for node_exporter's textfile collector)"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def serve(port, host='0.0.0.0'):
+    """Serve the aggregates at http://host:port/metrics from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if os.environ.get('MOVIEREEL_METRICS') == '1':
+    enable()
+if os.environ.get('MOVIEREEL_METRICS_PORT'):
+    enable()
+    serve(int(os.environ['MOVIEREEL_METRICS_PORT']))
@@ -0,0 +1,144 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+import numpy as np
+from metrics import timed
+from quantization import STORAGE_MODES, load_embeddings, save_embeddings
+
+MODEL_ROOT = 'models/ncf'
+LEGACY_PICKLE = 'models/ncf_embeddings.pkl'
+CURRENT_FILE = 'CURRENT'
+
+_lock = threading.Lock()
+_cached = None
+
+
+class NCFModel:
+    """Item embeddings plus a compact movie_id <-> row table.
+
+    `item_embeddings` is memory-mapped when loaded from a published artifact,
+    so every worker process shares the same pages. Quantized artifacts load
+    as a quantization store, which decodes rows to float32 on indexing.
+    """
+
+    def __init__(self, item_ids, item_embeddings, version=None):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.item_embeddings = item_embeddings
+        self.version = version
+
+        max_id = int(self.item_ids.max()) if len(self.item_ids) else -1
+        if (max_id < 0 or self.item_ids.min() >= 0) and max_id < max(4 * len(self.item_ids), 1 << 21):
+            self._table = np.full(max_id + 1, -1, dtype=np.int32)
+            self._table[self.item_ids] = np.arange(len(self.item_ids), dtype=np.int32)
+            self._order = None
+        else:
+            self._table = None
+            self._order = np.argsort(self.item_ids, kind='stable')
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def lookup(self, movie_ids):
+        """Embedding row of each id, aligned with the input; -1 for unknown ids"""
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        if self._table is not None:
+            inside = (ids >= 0) & (ids < len(self._table))
+            rows[inside] = self._table[ids[inside]]
+            return rows
+        if len(self.item_ids):
+            sorted_ids = self.item_ids[self._order]
+            pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            found = sorted_ids[pos] == ids
+            rows[found] = self._order[pos[found]]
+        return rows
+
+    def indices(self, movie_ids):
+        """Embedding rows of the given ids; ids the model has never seen are skipped"""
+        rows = self.lookup(movie_ids)
+        return rows[rows >= 0]
+
+    def ids(self, indices):
+        """Movie ids of the given embedding rows"""
+        return self.item_ids[indices]
+
+
+def publish(item_ids, item_embeddings, root=MODEL_ROOT, storage='float32'):
+    """Write a new artifact version and atomically make it current.
+
+    `storage` is one of quantization.STORAGE_MODES (float32, float16, int8, pq).
+    """
+    os.makedirs(root, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d-%H%M%S-'), dir=root)
+    version = os.path.basename(path)
+    np.save(os.path.join(path, 'item_ids.npy'), np.asarray(item_ids, dtype=np.int64))
+    save_embeddings(path, item_embeddings, storage)
+
+    tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    return version
+
+
+def convert_pickle(pickle_path=LEGACY_PICKLE, root=MODEL_ROOT, storage='float32'):
+    """Publish the embeddings of a notebook-exported pickle as a mmap-able artifact"""
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+    return publish(data['item_enc'].classes_, data['item_embeddings'], root, storage)
+
+
+def _current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+@timed('model.load')
+def load_model(root=MODEL_ROOT, legacy_pickle=LEGACY_PICKLE):
+    """Load the current published artifact, falling back to the legacy pickle"""
+    version = _current_version(root)
+    if version is None:
+        with open(legacy_pickle, 'rb') as f:
+            data = pickle.load(f)
+        return NCFModel(data['item_enc'].classes_, data['item_embeddings'],
+                        version=('pickle', os.stat(legacy_pickle).st_mtime_ns))
+    path = os.path.join(root, version)
+    item_ids = np.load(os.path.join(path, 'item_ids.npy'))
+    return NCFModel(item_ids, load_embeddings(path), version=version)
+
+
+def get_model(root=MODEL_ROOT, legacy_pickle=LEGACY_PICKLE):
+    """Process-wide model, swapped for the new one as soon as a new version is published"""
+    global _cached
+    version = _current_version(root)
+    if version is None:
+        version = ('pickle', os.stat(legacy_pickle).st_mtime_ns)
+    cached = _cached
+    if cached is not None and cached.version == version:
+        return cached
+    with _lock:
+        if _cached is None or _cached.version != version:
+            _cached = load_model(root, legacy_pickle)
+        return _cached
+
+
+def get_model_or_none(root=MODEL_ROOT, legacy_pickle=LEGACY_PICKLE):
+    """`get_model`, or None when neither a published artifact nor the legacy pickle exists"""
+    try:
+        return get_model(root, legacy_pickle)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Publish the legacy NCF pickle as a versioned artifact")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='float32')
+    args = parser.parse_args()
+    print(f"Published {MODEL_ROOT}/{convert_pickle(storage=args.storage)}")
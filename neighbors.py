@@ -0,0 +1,164 @@
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from model_registry import get_model, get_model_or_none
+
+NEIGHBORS_PATH = 'models/ncf_neighbors'
+NEIGHBOR_COUNT = 20
+BLOCK_SIZE = 1024      # query rows per task
+TILE_SIZE = 16_384     # item columns per multiply; each worker holds one block x tile float32 score matrix (64 MB)
+
+_lock = threading.Lock()
+_cached = None
+
+
+def _norms(embeddings, chunk=65_536):
+    norms = np.empty(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk):
+        norms[start:start + chunk] = np.linalg.norm(np.asarray(embeddings[start:start + chunk], dtype=np.float32), axis=1)
+    norms[norms == 0] = 1.0
+    return norms
+
+
+def _block_neighbors(embeddings, norms, start, stop, count, tile=TILE_SIZE):
+    """Top-`count` cosine neighbors (rows, similarities) of rows start..stop,
+    merging one column tile at a time so only block x tile scores are live.
+    """
+    queries = np.asarray(embeddings[start:stop], dtype=np.float32) / norms[start:stop, None]
+    rows = np.arange(start, stop)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_sims = np.empty((len(queries), 0), dtype=np.float32)
+    for col in range(0, len(embeddings), tile):
+        items = np.asarray(embeddings[col:col + tile], dtype=np.float32)
+        sims = (queries @ items.T) / norms[col:col + tile]
+        own = (rows >= col) & (rows < col + len(items))
+        sims[own, rows[own] - col] = -np.inf
+
+        k = min(count, sims.shape[1])
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        best_rows = np.hstack([best_rows, top + col])
+        best_sims = np.hstack([best_sims, np.take_along_axis(sims, top, axis=1)])
+        if best_rows.shape[1] > count:
+            keep = np.argpartition(-best_sims, count - 1, axis=1)[:, :count]
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_sims = np.take_along_axis(best_sims, keep, axis=1)
+
+    order = np.argsort(-best_sims, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_sims, order, axis=1)
+
+
+class NeighborTable:
+    """Top-N cosine neighbors of every item embedding row: int32 rows and
+    float16 similarities, built offline for one model version.
+    """
+
+    def __init__(self, neighbors, similarity, version):
+        self.neighbors = neighbors
+        self.similarity = similarity
+        self.version = version
+
+    @classmethod
+    def build(cls, embeddings, version, count=NEIGHBOR_COUNT, block=BLOCK_SIZE, workers=None):
+        """Blocked all-pairs search; blocks run on a thread pool since the
+        matrix multiplies and partitions release the GIL.
+        """
+        n = len(embeddings)
+        count = min(count, max(n - 1, 0))
+        neighbors = np.full((n, count), -1, dtype=np.int32)
+        similarity = np.zeros((n, count), dtype=np.float16)
+        norms = _norms(embeddings)
+
+        def run(start):
+            stop = min(start + block, n)
+            rows, sims = _block_neighbors(embeddings, norms, start, stop, count)
+            neighbors[start:stop] = rows
+            similarity[start:stop] = sims
+
+        if count:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+                list(pool.map(run, range(0, n, block)))
+        return cls(neighbors, similarity, version)
+
+    def save(self, path=NEIGHBORS_PATH):
+        tmp_dir = path + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, 'neighbors.npy'), self.neighbors)
+        np.save(os.path.join(tmp_dir, 'similarity.npy'), self.similarity)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'model_version': str(self.version)}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_dir, path)
+
+    @classmethod
+    def load(cls, path=NEIGHBORS_PATH):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return cls(np.load(os.path.join(path, 'neighbors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'similarity.npy'), mmap_mode='r'),
+                   meta['model_version'])
+
+    def lookup(self, row, k):
+        """Neighbor rows and similarities of one embedding row, best first"""
+        rows = np.asarray(self.neighbors[row][:k], dtype=np.int64)
+        sims = np.asarray(self.similarity[row][:k], dtype=np.float32)
+        valid = rows >= 0
+        return rows[valid], sims[valid]
+
+
+def get_neighbor_table(model, path=NEIGHBORS_PATH):
+    """The offline table when it was built for `model`, else None"""
+    global _cached
+    meta = os.path.join(path, 'meta.json')
+    version = os.stat(meta).st_mtime_ns if os.path.exists(meta) else None
+    key = (path, version, str(model.version))
+    with _lock:
+        if _cached is None or _cached[0] != key:
+            table = NeighborTable.load(path) if version is not None else None
+            if table is not None and (table.version != str(model.version) or len(table.neighbors) != len(model)):
+                table = None
+            _cached = (key, table)
+        return _cached[1]
+
+
+def similar_items(movie_id, k=NEIGHBOR_COUNT):
+    """Movie ids and cosine similarities of the titles most like `movie_id`.
+
+    Served from the precomputed table in O(1); when no table matches the
+    current model, falls back to scanning the embeddings for this one item.
+    Empty when there is no model or it has never seen the movie.
+    """
+    model = get_model_or_none()
+    row = int(model.lookup([movie_id])[0]) if model is not None else -1
+    if row < 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    table = get_neighbor_table(model)
+    if table is not None:
+        rows, sims = table.lookup(row, k)
+    else:
+        embeddings = model.item_embeddings
+        rows, sims = _block_neighbors(embeddings, _norms(embeddings), row, row + 1, min(k, len(embeddings) - 1))
+        rows, sims = rows[0], sims[0]
+    return model.ids(rows), sims
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Precompute the item-to-item neighbor table for the current NCF model")
+    parser.add_argument('--out', default=NEIGHBORS_PATH)
+    parser.add_argument('--count', type=int, default=NEIGHBOR_COUNT)
+    parser.add_argument('--block', type=int, default=BLOCK_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    model = get_model()
+    start = time.perf_counter()
+    table = NeighborTable.build(model.item_embeddings, model.version, args.count, args.block, args.workers)
+    table.save(args.out)
+    print(f"Wrote {len(table.neighbors)} x {table.neighbors.shape[1]} neighbors to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s")
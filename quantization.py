@@ -0,0 +1,243 @@
+"""Compressed storage for NCF item embeddings.
+
+Every store decodes rows to float32 on indexing (`store[rows]`) and scores a
+query against all or some rows with `store @ query` / `store.scores(query,
+rows)`, so retrieval, diversity and neighbor code work on any of them:
+
+* float16 - half the memory, rows widened per chunk when scoring;
+* int8    - a quarter of the memory plus one float32 scale per row;
+* pq      - product quantization: one uint8 code per subspace, scored with
+            asymmetric distance lookup tables (query x codebook inner products).
+
+The modes save resident memory, not scan time: NumPy has no fast
+low-precision matmul, so every compressed store scores slower than float32
+(float16 slowest, as widening it to float32 dominates). Compare the modes
+with `python quantization.py`.
+"""
+import os
+import numpy as np
+from retrieval import kmeans
+
+STORAGE_MODES = ('float32', 'float16', 'int8', 'pq')
+PQ_SUBSPACES = 8
+PQ_CENTROIDS = 256
+SCORE_CHUNK = 8192       # rows decoded per step; small enough to stay in cache
+
+
+class QuantizedEmbeddings:
+    """Base for compressed stores: subclasses implement `_decode(rows)`"""
+
+    shape = (0, 0)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            return self._decode(np.array([index]))[0]
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(len(self)))
+        return self._decode(np.asarray(index))
+
+    def __matmul__(self, query):
+        return self.scores(query)
+
+    def scores(self, query, rows=None):
+        """Inner product of `query` with every row, or only the given rows"""
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self) if rows is None else len(rows), dtype=np.float32)
+        for part, index in self._chunks(rows):
+            out[part] = self._decode(index) @ query
+        return out
+
+    def _chunks(self, rows):
+        """(output slice, row index) per SCORE_CHUNK rows: contiguous slices of
+        the store on a full scan, so no row ids are built or gathered
+        """
+        n = len(self) if rows is None else len(rows)
+        if rows is not None:
+            rows = np.asarray(rows)
+        for start in range(0, n, SCORE_CHUNK):
+            part = slice(start, min(start + SCORE_CHUNK, n))
+            yield part, part if rows is None else rows[part]
+
+
+class Float16Embeddings(QuantizedEmbeddings):
+    def __init__(self, values):
+        self.values = values
+        self.shape = values.shape
+        self.nbytes = values.nbytes
+
+    @classmethod
+    def encode(cls, embeddings):
+        return cls(np.asarray(embeddings, dtype=np.float16))
+
+    def _decode(self, rows):
+        return self.values[rows].astype(np.float32)
+
+
+class Int8Embeddings(QuantizedEmbeddings):
+    """Symmetric per-row int8: row = codes * scale, scale = max |x| / 127"""
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+        self.shape = codes.shape
+        self.nbytes = codes.nbytes + scales.nbytes
+
+    @classmethod
+    def encode(cls, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(embeddings / scales[:, None]).astype(np.int8)
+        return cls(codes, scales.astype(np.float32))
+
+    def _decode(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows, None]
+
+    def scores(self, query, rows=None):
+        """Scale once per row instead of once per element"""
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self) if rows is None else len(rows), dtype=np.float32)
+        for part, index in self._chunks(rows):
+            out[part] = (self.codes[index].astype(np.float32) @ query) * self.scales[index]
+        return out
+
+
+class PQEmbeddings(QuantizedEmbeddings):
+    """Product quantization: each row is split into `m` subvectors, each
+    replaced by the uint8 id of its nearest centroid in that subspace.
+    """
+
+    def __init__(self, codes, codebooks):
+        self.codes = codes
+        self.codebooks = codebooks
+        m, _, sub_dim = codebooks.shape
+        self.shape = (len(codes), m * sub_dim)
+        self.nbytes = codes.nbytes + codebooks.nbytes
+
+    @classmethod
+    def encode(cls, embeddings, subspaces=PQ_SUBSPACES, n_iter=10, sample_size=100_000, seed=0):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n, dim = embeddings.shape
+        m = next(m for m in range(min(subspaces, dim), 0, -1) if dim % m == 0)
+        sub_dim = dim // m
+        rng = np.random.default_rng(seed)
+        sample = embeddings[rng.choice(n, min(n, sample_size), replace=False)]
+        codebooks = np.zeros((m, min(PQ_CENTROIDS, len(sample)), sub_dim), dtype=np.float32)
+        codes = np.empty((n, m), dtype=np.uint8)
+        for i in range(m):
+            part = slice(i * sub_dim, (i + 1) * sub_dim)
+            centroids = kmeans(np.ascontiguousarray(sample[:, part]), PQ_CENTROIDS, n_iter, rng)
+            codebooks[i, :len(centroids)] = centroids
+            codes[:, i] = _nearest(embeddings[:, part], centroids)
+        return cls(codes, codebooks)
+
+    def _decode(self, rows):
+        codes = self.codes[rows]
+        return np.concatenate([self.codebooks[i][codes[:, i]] for i in range(codes.shape[1])], axis=1)
+
+    def scores(self, query, rows=None):
+        """Asymmetric distance computation: one (m x 256) table of query-centroid
+        inner products, then each score is a sum of m table lookups.
+        """
+        m, _, sub_dim = self.codebooks.shape
+        table = np.einsum('mkd,md->mk', self.codebooks, np.asarray(query, dtype=np.float32).reshape(m, sub_dim))
+        out = np.empty(len(self) if rows is None else len(rows), dtype=np.float32)
+        for part, index in self._chunks(rows):
+            codes = self.codes[index]
+            chunk = table[0][codes[:, 0]]
+            for i in range(1, m):
+                chunk += table[i][codes[:, i]]
+            out[part] = chunk
+        return out
+
+
+def _nearest(vectors, centroids, chunk=SCORE_CHUNK):
+    norms = (centroids ** 2).sum(axis=1)
+    nearest = np.empty(len(vectors), dtype=np.uint8)
+    for start in range(0, len(vectors), chunk):
+        nearest[start:start + chunk] = np.argmin(norms - 2 * vectors[start:start + chunk] @ centroids.T, axis=1)
+    return nearest
+
+
+def quantize(embeddings, storage):
+    """Encode float embeddings in one of STORAGE_MODES"""
+    if storage == 'float32':
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    if storage == 'float16':
+        return Float16Embeddings.encode(embeddings)
+    if storage == 'int8':
+        return Int8Embeddings.encode(embeddings)
+    if storage == 'pq':
+        return PQEmbeddings.encode(embeddings)
+    raise ValueError(f"Unknown embedding storage {storage!r}; expected one of {STORAGE_MODES}")
+
+
+def save_embeddings(path, embeddings, storage='float32'):
+    """Write embeddings into a model artifact directory in the given storage mode"""
+    store = quantize(embeddings, storage)
+    if isinstance(store, Int8Embeddings):
+        np.save(os.path.join(path, 'item_embeddings.npy'), store.codes)
+        np.save(os.path.join(path, 'item_scales.npy'), store.scales)
+    elif isinstance(store, PQEmbeddings):
+        np.save(os.path.join(path, 'pq_codes.npy'), store.codes)
+        np.save(os.path.join(path, 'pq_codebooks.npy'), store.codebooks)
+    elif isinstance(store, Float16Embeddings):
+        np.save(os.path.join(path, 'item_embeddings.npy'), store.values)
+    else:
+        np.save(os.path.join(path, 'item_embeddings.npy'), store)
+
+
+def load_embeddings(path):
+    """Memory-map the embeddings of an artifact directory, whatever their storage mode"""
+    def load(name):
+        return np.load(os.path.join(path, name), mmap_mode='r')
+
+    if os.path.exists(os.path.join(path, 'pq_codes.npy')):
+        return PQEmbeddings(load('pq_codes.npy'), np.load(os.path.join(path, 'pq_codebooks.npy')))
+    values = load('item_embeddings.npy')
+    if os.path.exists(os.path.join(path, 'item_scales.npy')):
+        return Int8Embeddings(values, np.load(os.path.join(path, 'item_scales.npy')))
+    if values.dtype == np.float16:
+        return Float16Embeddings(values)
+    return values
+
+
+def report(embeddings, k=36, n_queries=200, seed=0):
+    """Memory, full-scan scoring latency and recall@k against float32 for each storage mode"""
+    from retrieval import ExactIndex, evaluate_recall
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = [embeddings[rng.choice(len(embeddings), 20)].mean(axis=0) for _ in range(n_queries)]
+    rows = []
+    for storage in STORAGE_MODES:
+        store = quantize(embeddings, storage)
+        result = evaluate_recall(ExactIndex(store), embeddings, queries, k=k)
+        rows.append({
+            'storage': storage,
+            'megabytes': store.nbytes / 2 ** 20,
+            'score_ms': result['approx_ms'],
+            'items_per_second': len(embeddings) / max(result['approx_ms'] / 1000, 1e-9),
+            'recall_at_k': result['recall_at_k'],
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    from model_registry import get_model
+
+    parser = argparse.ArgumentParser(description="Compare embedding storage modes against float32")
+    parser.add_argument('--k', type=int, default=36)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings = get_model().item_embeddings
+    if not isinstance(embeddings, np.ndarray):
+        embeddings = embeddings[:]
+    for row in report(embeddings, k=args.k, n_queries=args.queries):
+        print(f"{row['storage']:<8} {row['megabytes']:9.2f} MB  {row['score_ms']:8.3f} ms/query  "
+              f"{row['items_per_second'] / 1e6:8.1f} M items/s  recall@{args.k}={row['recall_at_k']:.3f}")
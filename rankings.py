@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+from catalog import get_catalog
+from data.director import TOP_DIRECTORS
+
+MAX_LIST_LENGTH = 500
+MIN_VOTES_QUANTILE = 0.8
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+_lock = threading.Lock()
+_cached = None
+
+
+def quality_scores(movies):
+    """Vote-count-aware rating (IMDb weighted rating) when the catalog has vote
+    counts; plain vote_average otherwise.
+    """
+    average = movies['vote_average'].to_numpy(dtype=np.float64)
+    if 'vote_count' not in movies:
+        return np.nan_to_num(average, nan=0.0)
+    votes = np.nan_to_num(movies['vote_count'].to_numpy(dtype=np.float64), nan=0.0)
+    mean = np.nanmean(average)
+    min_votes = max(np.quantile(votes, MIN_VOTES_QUANTILE), 1.0)
+    average = np.nan_to_num(average, nan=mean)
+    return (votes * average + min_votes * mean) / (votes + min_votes)
+
+
+class Rankings:
+    """Ranked catalog positions, materialized once per catalog version.
+
+    'popular' is the curated-director list behind the General tab; every genre
+    and director in the catalog also gets its own list, so new ones show up as
+    soon as the catalog contains them.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        movies = catalog.movies
+        self.scores = quality_scores(movies)
+        order = np.argsort(-self.scores, kind='stable')
+
+        directors = movies['director'].to_numpy()[order]
+        self.lists = {
+            'popular': order[np.isin(directors, list(set(TOP_DIRECTORS)))][:MAX_LIST_LENGTH],
+            'all': order[:MAX_LIST_LENGTH],
+        }
+
+        buckets = {}
+        for pos, director in zip(order.tolist(), directors.tolist()):
+            if isinstance(director, str) and director != "Unknown":
+                buckets.setdefault(('director', director), []).append(pos)
+            for genre in catalog.genre_lists[pos]:
+                buckets.setdefault(('genre', genre), []).append(pos)
+        for key, positions in buckets.items():
+            self.lists[key] = np.asarray(positions[:MAX_LIST_LENGTH], dtype=np.int64)
+
+    def positions(self, name, k):
+        """Top-k catalog positions of a list; empty for unknown list names"""
+        return self.lists.get(name, _EMPTY)[:k]
+
+    def top(self, name, k):
+        """Top-k catalog rows of a list; unknown list names fall back to 'all'"""
+        return self.catalog.movies.iloc[self.positions(name if name in self.lists else 'all', k)]
+
+    def names(self, kind):
+        return sorted(key[1] for key in self.lists if isinstance(key, tuple) and key[0] == kind)
+
+
+def get_rankings():
+    """Rankings for the current catalog, rebuilt when the catalog reloads"""
+    global _cached
+    catalog = get_catalog()
+    cached = _cached
+    if cached is not None and cached.catalog is catalog:
+        return cached
+    with _lock:
+        if _cached is None or _cached.catalog is not catalog:
+            _cached = Rankings(catalog)
+        return _cached
@@ -1,132 +1,269 @@
-import pandas as pd
-import pickle
+import time
 import numpy as np
-from data.director import TOP_DIRECTORS
+from catalog import get_catalog, lead_actors, liked_profile, most_common
+from content_engine import get_content_engine
+from database import get_stored_recommendations, get_taste_profile, get_user_embedding, store_recommendations
+from diversity import mmr
+from metrics import count, observe, span, timed
+from model_registry import get_model, get_model_or_none
+from neighbors import similar_items
+from rankings import get_rankings
+from retrieval import get_index, top_k as top_k_positions
+
+DIVERSITY_POOL = 10   # candidates per requested result handed to the diversity reranker
+
 #*****************************General Recommendation*********************************************
+@timed('recommendation.general')
 def get_general_recommendations(top_k=50):
-    movies = pd.read_csv('data/curated_data (1).csv')
-    movies['release_date'] = pd.to_datetime(movies['release_date'], errors='coerce')
-    
-    recent_movies = movies[
-        (movies['director'].isin(TOP_DIRECTORS))
-    ]    
-    recent_movies = recent_movies.sort_values(
-        'vote_average', 
-        ascending=False
-    )
-    return recent_movies.head(top_k)
+    """Popular films from the curated directors, served from the materialized rankings"""
+    return get_rankings().top('popular', top_k)
 
 
 #*****************************Content Based Recommendation*********************************************
-def get_content_based_recommendations(user_ratings_df, top_k=12):
-    """Recommend movies based on director, actor, and genre similarity"""
+@timed('recommendation.content')
+def get_content_based_recommendations(user_ratings_df, top_k=12, user_id=None):
+    """Recommend movies based on director, actor, and genre similarity.
+
+    With a `user_id` the profile comes from the stored taste counts instead of
+    being rebuilt from every rated movie.
+    """
     
     if len(user_ratings_df) == 0:
         return get_general_recommendations(top_k)
     
-    movies = pd.read_csv('data/curated_data (1).csv')
+    catalog = get_catalog()
     
     liked_movie_ids = user_ratings_df['movie_id'].values
-    liked_movies = movies[movies['movie_id'].isin(liked_movie_ids)]
+    liked_positions = catalog.positions(liked_movie_ids)
     
-    if len(liked_movies) == 0:
+    if len(liked_positions) == 0:
         return get_general_recommendations(top_k)
     
-    user_profile = {
-        'directors': set(),
-        'actors': set(),
-        'genres': set()
-    }
-    
-    for _, movie in liked_movies.iterrows():
-        if pd.notna(movie['director']) and movie['director'] != "Unknown":
-            user_profile['directors'].add(movie['director'])
-        
-        if 'top_actors_str' in movie and pd.notna(movie['top_actors_str']):
-            actors = [a.strip() for a in movie['top_actors_str'].split(',') if a.strip()]
-            user_profile['actors'].update(actors[:3])  # Top 3 actors
-        
-        if 'genres' in movie and pd.notna(movie['genres']):
-            genres = [g.strip() for g in movie['genres'].split(',') if g.strip()]
-            user_profile['genres'].update(genres)
-    
-    candidate_movies = movies[~movies['movie_id'].isin(liked_movie_ids)].copy()
-    
-    candidate_movies['director_match'] = candidate_movies['director'].isin(user_profile['directors'])
-    candidate_movies['genres_list'] = candidate_movies['genres'].apply(
-        lambda x: set([g.strip() for g in x if g.strip()]) if isinstance(x, list) or pd.notna(x) else set()
-    )
-    
-    candidate_movies['actors_list'] = candidate_movies['top_actors'].apply(
-        lambda x: set([a.strip() for a in x if a.strip()]) if isinstance(x, list) or pd.notna(x) else set()
-    )
-    
-    def compute_score(row):
-        score = 0.0
-        
-        if row['director_match']:
-            score += 0.3
-        
-        actor_overlap = len(row['actors_list'].intersection(user_profile['actors']))
-        score += 0.35 * min(actor_overlap / 3, 1.0)  
-        
-        genre_jaccard = len(row['genres_list'].intersection(user_profile['genres'])) / len(user_profile['genres']) if user_profile['genres'] else 0
-        score += 0.25 * genre_jaccard
-        
-        popularity_norm = row['vote_average'] 
-        score += 0.1 * popularity_norm
-        
-        return score
-    
-    candidate_movies['content_score'] = candidate_movies.apply(compute_score, axis=1)
-    
-    recommendations = candidate_movies.sort_values('content_score', ascending=False).head(top_k * 2)
-    
-    final_recs = []
-    director_count = {}
-    
-    for _, movie in recommendations.iterrows():
-        director = movie['director']
-        if director not in director_count:
-            director_count[director] = 0
-        if director_count[director] < 2:  
-            final_recs.append(movie)
-            director_count[director] += 1
-        if len(final_recs) >= top_k:
-            break
-    
-
-    
-    return pd.DataFrame(final_recs)
+    taste = get_taste_profile(user_id) if user_id is not None else catalog.taste_counts(liked_movie_ids)
+    user_profile = liked_profile(taste)
+    
+    engine = get_content_engine()
+    profile = (user_profile['liked_directors'], lead_actors(taste), user_profile['liked_genres'])
+    pool = top_k * DIVERSITY_POOL
+    with span('recommendation.content.score'):
+        positions, scores, bound = engine.score_reach(*profile)
+        rated = np.flatnonzero(np.isin(positions, liked_positions))
+        top = engine.top_k(scores, pool, exclude=rated) if len(positions) - len(rated) >= pool else None
+        if top is not None and scores[top[-1]] > bound:
+            top_positions, top_scores = positions[top], scores[top]
+        else:
+            # Profile reaches too few movies, or one outside its reach could still make the pool;
+            # rank the whole catalog instead
+            count('recommendation.content.full_scans')
+            scores = engine.score(*profile)
+            top_positions = engine.top_k(scores, pool, exclude=liked_positions)
+            top_scores = scores[top_positions]
+    
+    return _diversify(top_positions, top_scores, top_k, 'content_score')
+
+
+@timed('recommendation.diversify')
+def _diversify(positions, relevance, top_k, score_column=None):
+    """Catalog rows of the top_k candidates after MMR over the NCF item
+    embeddings, with at most two per director. Candidates the model has never
+    seen count as dissimilar to everything; without a model only the director
+    cap diversifies.
+    """
+    catalog = get_catalog()
+    model = get_model_or_none()
+    positions = np.asarray(positions, dtype=np.int64)
+    if model is None:
+        embeddings = np.zeros((len(positions), 1), dtype=np.float32)
+    else:
+        rows = model.lookup(catalog.movie_ids[positions])
+        known = rows >= 0
+        embeddings = np.zeros((len(positions), model.item_embeddings.shape[1]), dtype=np.float32)
+        embeddings[known] = model.item_embeddings[rows[known]]
+    
+    order = mmr(relevance, embeddings, top_k, groups=get_content_engine().director_codes[positions])
+    recs = catalog.movies.iloc[positions[order]].copy()
+    if score_column is not None:
+        recs[score_column] = np.asarray(relevance)[order]
+    return recs
 
 
 #*****************************NCF Based Recommendation*********************************************
 
-def get_ncf_recommendations(user_ratings_df, top_k=12):
-    """Use pseudo-user embedding from liked movies"""
+def _pseudo_user(model, item_indices, user_id=None):
+    """Stored embedding of a known user, else the mean of the liked movies' embeddings"""
+    if user_id is not None:
+        return get_user_embedding(user_id)
+    return model.item_embeddings[item_indices].mean(axis=0) if len(item_indices) else None
+
+
+@timed('recommendation.ncf')
+def get_ncf_recommendations(user_ratings_df, top_k=12, user_id=None):
+    """Use pseudo-user embedding from liked movies.
+
+    With a `user_id` the stored, rating-weighted user embedding is read instead
+    of averaging the embeddings of every rated movie.
+    """
+    
+    liked_movie_ids = user_ratings_df['movie_id'].values
+    model = get_model()
+    item_embeddings = model.item_embeddings
+    item_indices = model.indices(liked_movie_ids)
+    pseudo_user_emb = _pseudo_user(model, item_indices, user_id)
+    if pseudo_user_emb is None:
+        return get_content_based_recommendations(user_ratings_df, top_k, user_id)
+    
+    rated = np.zeros(len(item_embeddings), dtype=bool)
+    rated[item_indices] = True
+    with span('recommendation.ncf.search'):
+        top_indices, _ = get_index(model).search(pseudo_user_emb, 3*top_k, exclude=rated)
+    
+    catalog = get_catalog()
+    positions = np.asarray(catalog.positions(model.ids(top_indices).tolist()), dtype=np.int64)
+    
+    return _diversify(positions, catalog.movies['vote_average'].to_numpy(dtype=np.float64)[positions], top_k)
+
+
+#*****************************Hybrid Recommendation*********************************************
+HYBRID_WEIGHTS = {'content': 0.5, 'embedding': 0.3, 'quality': 0.2}
+NCF_CANDIDATES = 200
+POPULAR_CANDIDATES = 50
+DIRECTOR_CANDIDATES = 20   # per liked director
+ACTOR_CANDIDATES = 20      # per liked lead actor
+GENRE_CANDIDATES = 50      # per favourite genre
+PROFILE_DIRECTORS = 10
+PROFILE_ACTORS = 10
+PROFILE_GENRES = 3
+
+
+def _normalize(values):
+    if len(values) == 0:
+        return values
+    span = values.max() - values.min()
+    return (values - values.min()) / span if span > 0 else np.zeros(len(values))
+
+
+@timed('recommendation.hybrid')
+def get_hybrid_recommendations(user_ratings_df, top_k=12, user_id=None, weights=None):
+    """Two-stage recommendations: cheap candidate generators (popular, liked
+    directors, lead actors and genres, NCF top-N), then one rerank that blends
+    content score, embedding similarity and quality with `weights`.
+
+    Work scales with the few hundred candidates, not the catalog. Seconds spent
+    per stage are returned in `recs.attrs['timings']`.
+    """
+    weights = {**HYBRID_WEIGHTS, **(weights or {})}
+    timings = {}
+    start = time.perf_counter()
+    
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = now - start
+        observe(f'recommendation.hybrid.{stage}', start, now)
+        start = now
     
-    movies = pd.read_csv('data/curated_data (1).csv')
+    if len(user_ratings_df) == 0:
+        return get_general_recommendations(top_k)
     
+    catalog = get_catalog()
+    rankings = get_rankings()
     liked_movie_ids = user_ratings_df['movie_id'].values
-    with open('models/ncf_embeddings.pkl','rb') as data:
-        data = pickle.load(data)
-    item_enc = data['item_enc']
-    item_embeddings = data['item_embeddings']
-    try:
-        item_indices = item_enc.transform(liked_movie_ids)
-    except:
-        return get_content_based_recommendations(user_ratings_df, top_k)
-    
-    liked_embs = item_embeddings[item_indices]
-    pseudo_user_emb = liked_embs.mean(axis=0)
-    
-    scores = item_embeddings @ pseudo_user_emb
-    top_indices = np.argsort(scores)[::-1][:3*top_k ] 
-    
-    movie_ids = item_enc.inverse_transform(top_indices)
-    
-    recs = movies[movies['movie_id'].isin(movie_ids)].sort_values(
-    by='vote_average', 
-    ascending=False
-).head(top_k)
-    return recs
\ No newline at end of file
+    taste = get_taste_profile(user_id) if user_id is not None else catalog.taste_counts(liked_movie_ids)
+    user_profile = liked_profile(taste)
+    model = get_model()
+    item_indices = model.indices(liked_movie_ids)
+    pseudo_user_emb = _pseudo_user(model, item_indices, user_id)
+    lap('profile')
+    
+    candidates = [rankings.positions('popular', POPULAR_CANDIDATES)]
+    for director in most_common(taste, 'director', PROFILE_DIRECTORS):
+        candidates.append(rankings.positions(('director', director), DIRECTOR_CANDIDATES))
+    # Actor postings are in catalog order; keep each actor's best-ranked titles
+    for rows in get_content_engine().posting_lists('actor', most_common(taste, 'lead', PROFILE_ACTORS)):
+        candidates.append(rows[top_k_positions(rankings.scores[rows], ACTOR_CANDIDATES)].astype(np.int64))
+    for genre in most_common(taste, 'genre', PROFILE_GENRES):
+        candidates.append(rankings.positions(('genre', genre), GENRE_CANDIDATES))
+    lap('attribute_candidates')
+    
+    if pseudo_user_emb is not None:
+        rated = np.zeros(len(model), dtype=bool)
+        rated[item_indices] = True
+        top_indices, _ = get_index(model).search(pseudo_user_emb, NCF_CANDIDATES, exclude=rated)
+        candidates.append(np.asarray(catalog.positions(model.ids(top_indices).tolist()), dtype=np.int64))
+    lap('ncf_candidates')
+    
+    candidates = np.setdiff1d(np.concatenate(candidates), catalog.positions(liked_movie_ids))
+    
+    content = get_content_engine().score(user_profile['liked_directors'], lead_actors(taste),
+                                         user_profile['liked_genres'], positions=candidates)
+    similarity = np.zeros(len(candidates))
+    if pseudo_user_emb is not None:
+        rows = model.lookup(catalog.movie_ids[candidates])
+        known = rows >= 0
+        similarity[known] = _normalize(np.asarray(model.item_embeddings[rows[known]] @ pseudo_user_emb, dtype=np.float64))
+    quality = rankings.scores[candidates]
+    
+    blended = (weights['content'] * _normalize(content)
+               + weights['embedding'] * similarity
+               + weights['quality'] * _normalize(quality))
+    order = top_k_positions(blended, top_k * DIVERSITY_POOL)
+    lap('rerank')
+    
+    recs = _diversify(candidates[order], blended[order], top_k, 'hybrid_score')
+    lap('diversify')
+    
+    recs.attrs['timings'] = timings
+    recs.attrs['candidates'] = len(candidates)
+    return recs
+
+
+#*****************************More Like This*********************************************
+@timed('recommendation.similar')
+def get_similar_movies(movie_id, top_k=12):
+    """Titles closest to `movie_id` in the NCF embedding space, from the precomputed neighbor table"""
+    catalog = get_catalog()
+    movie_ids, similarity = similar_items(movie_id, top_k)
+    found = [pos for pos, mid in enumerate(movie_ids.tolist()) if mid in catalog.index]
+    recs = catalog.rows(movie_ids[found].tolist()).copy()
+    recs['similarity'] = similarity[found]
+    return recs
+
+
+#*****************************Precomputed Recommendation*********************************************
+# Lists the batch job precomputes and the UI reads back; see batch_recommend.py
+PRECOMPUTED = {
+    'content': get_content_based_recommendations,
+    'ncf': get_ncf_recommendations,
+    'hybrid': get_hybrid_recommendations,
+}
+
+
+def recommendation_version(user_ratings_df):
+    """The inputs a list is computed from: catalog, model and the user's ratings.
+    A stored list is fresh while this is unchanged.
+    """
+    latest = user_ratings_df['timestamp'].max() if 'timestamp' in user_ratings_df and len(user_ratings_df) else None
+    model = get_model_or_none()
+    model_version = model.version if model is not None else None
+    return f"{get_catalog().version}|{model_version}|{len(user_ratings_df)}|{latest}"
+
+
+@timed('recommendation.get')
+def get_recommendations(kind, user_ratings_df, top_k=12, user_id=None):
+    """The stored `kind` list when it is still fresh; otherwise compute it now
+    and store it for the next render.
+    """
+    recommend = PRECOMPUTED[kind]
+    if user_id is None:
+        return recommend(user_ratings_df, top_k)
+    
+    version = recommendation_version(user_ratings_df)
+    stored = get_stored_recommendations(user_id, kind)
+    if stored is not None and stored[0] == version and len(stored[1]) >= top_k:
+        count(f'recommendation.{kind}.stored_hits')
+        return get_catalog().rows(stored[1][:top_k])
+    
+    count(f'recommendation.{kind}.stored_misses')
+    recs = recommend(user_ratings_df, top_k, user_id)
+    store_recommendations([(user_id, kind, version, recs['movie_id'].tolist())])
+    return recs
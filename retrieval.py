@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import numpy as np
+
+IVF_INDEX_PATH = 'models/ncf_ivf.npz'
+DEFAULT_NPROBE = 8
+
+_lock = threading.Lock()
+_cached = None
+
+
+def top_k(scores, k):
+    """Positions of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class ExactIndex:
+    """Brute-force inner-product search over the item embeddings"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def search(self, query, k, exclude=None):
+        """Top-k item indices and scores for `query`; `exclude` is a boolean mask over items"""
+        scores = self.embeddings @ query
+        if exclude is not None:
+            scores[exclude] = -np.inf
+            k = min(k, len(scores) - int(exclude.sum()))
+        top = top_k(scores, k)
+        return top, scores[top]
+
+
+class IVFIndex:
+    """Cluster-probe index: items are bucketed by k-means centroid and only
+    the `nprobe` buckets closest to the query are scored. Built offline for
+    one model version.
+    """
+
+    def __init__(self, embeddings, centroids, offsets, items, version=None, nprobe=DEFAULT_NPROBE):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+        self.version = version
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, version=None, n_lists=None, n_iter=10, sample_size=100_000, seed=0,
+              nprobe=DEFAULT_NPROBE):
+        """Run k-means on a sample of the embeddings and bucket every item"""
+        n = len(embeddings)
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = embeddings[rng.choice(n, min(n, sample_size), replace=False)].astype(np.float32)
+        centroids = kmeans(sample, n_lists, n_iter, rng)
+        n_lists = len(centroids)
+
+        assign = _assign(embeddings, centroids)
+        items = np.argsort(assign, kind='stable').astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=n_lists), out=offsets[1:])
+        return cls(embeddings, centroids, offsets, items, str(version), nprobe=nprobe)
+
+    def save(self, path=IVF_INDEX_PATH):
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, items=self.items,
+                 model_version=np.array(str(self.version)))
+
+    @classmethod
+    def load(cls, embeddings, version, path=IVF_INDEX_PATH, nprobe=DEFAULT_NPROBE):
+        """Index saved at `path`; ValueError unless it was built for model `version`"""
+        data = np.load(path)
+        built_for = str(data['model_version']) if 'model_version' in data.files else None
+        if built_for != str(version) or len(data['items']) != len(embeddings):
+            raise ValueError(f"IVF index at {path} was not built for model version {version}")
+        return cls(embeddings, data['centroids'], data['offsets'], data['items'], built_for, nprobe=nprobe)
+
+    def search(self, query, k, exclude=None, nprobe=None):
+        """Approximate top-k item indices and scores; same contract as `ExactIndex.search`"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.items[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        if exclude is not None:
+            candidates = candidates[~exclude[candidates]]
+        scores = score_rows(self.embeddings, query, candidates)
+        top = top_k(scores, k)
+        return candidates[top], scores[top]
+
+
+def score_rows(embeddings, query, rows):
+    """Inner products of the given rows with `query`; quantized stores score
+    their codes directly instead of decoding the rows first.
+    """
+    if isinstance(embeddings, np.ndarray):
+        return embeddings[rows] @ query
+    return embeddings.scores(query, rows)
+
+
+def kmeans(sample, n_clusters, n_iter=10, rng=None):
+    """Lloyd's k-means on `sample`, seeded with randomly chosen points"""
+    rng = rng or np.random.default_rng(0)
+    n_clusters = min(n_clusters, len(sample))
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_clusters)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def _assign(vectors, centroids, chunk=65_536):
+    """Nearest centroid (L2) per vector, computed in chunks to bound memory"""
+    norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        assign[start:start + chunk] = np.argmin(norms - 2 * block @ centroids.T, axis=1)
+    return assign
+
+
+def get_index(model, path=IVF_INDEX_PATH):
+    """IVF index if one was built offline for `model`, else exact search"""
+    global _cached
+    embeddings = model.item_embeddings
+    version = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    key = (path, version, str(model.version))
+    with _lock:
+        if _cached is None or _cached[0] != key or _cached[1].embeddings is not embeddings:
+            index = ExactIndex(embeddings)
+            if version is not None:
+                try:
+                    index = IVFIndex.load(embeddings, model.version, path)
+                except ValueError:
+                    pass
+            _cached = (key, index)
+        return _cached[1]
+
+
+def evaluate_recall(index, embeddings, queries, k=36):
+    """Recall@k of `index` against exact search, with mean latency of both"""
+    exact = ExactIndex(embeddings)
+    hits, exact_time, approx_time = 0, 0.0, 0.0
+    for query in queries:
+        start = time.perf_counter()
+        truth, _ = exact.search(query, k)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        found, _ = index.search(query, k)
+        approx_time += time.perf_counter() - start
+        hits += len(np.intersect1d(truth, found))
+    n = max(len(queries), 1)
+    return {
+        'recall_at_k': hits / (n * k),
+        'exact_ms': 1000 * exact_time / n,
+        'approx_ms': 1000 * approx_time / n,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    from model_registry import get_model
+
+    parser = argparse.ArgumentParser(description="Build the IVF index for the current NCF model and report recall@k vs exact search")
+    parser.add_argument('--out', default=IVF_INDEX_PATH)
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--k', type=int, default=36)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    model = get_model()
+    item_embeddings = model.item_embeddings
+    ivf = IVFIndex.build(item_embeddings, model.version, n_lists=args.lists)
+    ivf.save(args.out)
+
+    rng = np.random.default_rng(0)
+    queries = [item_embeddings[rng.choice(len(item_embeddings), 20)].mean(axis=0) for _ in range(args.queries)]
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        ivf.nprobe = nprobe
+        report = evaluate_recall(ivf, item_embeddings, queries, k=args.k)
+        print(f"nprobe={nprobe:<3} recall@{args.k}={report['recall_at_k']:.3f} "
+              f"exact={report['exact_ms']:.2f}ms ivf={report['approx_ms']:.2f}ms")
@@ -2,26 +2,66 @@
 import streamlit as st
 import pandas as pd
 import google.generativeai as genai
-from ai_gen import generate_ai_explanation,get_personality,get_taste_evolution
-from database import register_user, authenticate_user, save_rating, get_user_ratings, get_rating_count
-from recommendation import get_general_recommendations, get_content_based_recommendations, get_ncf_recommendations
-
-def show_movie_grid(movies_df, user_id,tab_name,ai_mode):
-    """Display movies in a grid with rating options"""
-    user_ratings = {}
-    if user_id:
-        user_ratings_df = get_user_ratings(user_id)
-        user_ratings = dict(zip(user_ratings_df['movie_id'], user_ratings_df['rating']))
-    movies = pd.read_csv('data/curated_data (1).csv')   
-    liked_movies = movies[movies['movie_id'].isin(user_ratings.keys())]
-    user_profile = {
-        'liked_directors': set(liked_movies['director'].dropna()),
-        'liked_actors': set(a for actors in liked_movies['top_actors'].dropna() for a in actors.split(', ')),
-        'liked_genres': set(g for genres in liked_movies['genres'].dropna() for g in genres.split(', ')),
-    }
-    cols = st.columns(4)
-    for idx, (_, row) in enumerate(movies_df.iterrows()):
-        with cols[idx % 4]:
+import metrics
+from ai_gen import generate_ai_explanations,stream_insights
+from database import register_user, authenticate_user
+from model_registry import get_model_or_none
+from recommendation import get_general_recommendations, get_recommendations, get_similar_movies
+from user_state import UserState
+
+GRID_COLUMNS = 4
+GRID_PAGE_SIZE = 12
+UNLOCK_COUNTS = (10, 20)   # rating counts that unlock the personalized tab, and the NCF and hybrid tabs
+
+
+@st.fragment
+def rating_widget(user_state, movie_id, key):
+    """Rating selectbox for one movie; a change reruns only this widget, or
+    the whole page when it unlocks a tab.
+    """
+    current_rating = user_state.ratings.get(movie_id, 0)
+    rating = st.selectbox(
+        "Rate this movie",
+        options=[0, 1, 2, 3, 4, 5],
+        index=current_rating,
+        key=key,
+        label_visibility="collapsed"
+    )
+    if rating != current_rating and rating > 3:
+        before = user_state.rating_count
+        if user_state.rate(movie_id, rating):
+            if any(before < unlock <= user_state.rating_count for unlock in UNLOCK_COUNTS):
+                st.rerun()
+            st.success("Saved!")
+
+
+def _set_page(key, page):
+    st.session_state[key] = page
+
+
+@st.fragment
+@metrics.timed('ui.movie_grid')
+def show_movie_grid(movies_df, user_state,tab_name,ai_mode,allow_similar=True):
+    """Display one page of movies in a grid with rating and "more like this" options.
+
+    Paging, rating and "more like this" rerun only this grid, not the page.
+    "More like this" needs the NCF model and is hidden without one.
+    """
+    allow_similar = allow_similar and get_model_or_none() is not None
+    user_id = user_state.user_id
+    user_profile = user_state.profile
+    page_key = f"grid_page_{tab_name}"
+    pages = max(-(-len(movies_df) // GRID_PAGE_SIZE), 1)
+    page = min(st.session_state.get(page_key, 0), pages - 1)
+    first = page * GRID_PAGE_SIZE
+    page_df = movies_df.iloc[first:first + GRID_PAGE_SIZE]
+    explanations = {}
+    if ai_mode == True and tab_name=='personal':
+        with st.spinner("Writing your explanations..."):
+            explanations = generate_ai_explanations(user_profile, page_df, st.session_state.gemini_api_key, user_id=user_id)
+    cols = st.columns(GRID_COLUMNS)
+    for idx, (_, row) in enumerate(page_df.iterrows(), start=first):
+        with cols[idx % GRID_COLUMNS]:
             if pd.notna(row['poster_path']):
                 poster_url = f"https://image.tmdb.org/t/p/w300{row['poster_path']}"
                 st.image(poster_url, width=150)
@@ -33,34 +73,51 @@ def show_movie_grid(movies_df, user_id,tab_name,ai_mode):
 
             if ai_mode == True and tab_name=='personal' :
                 with st.expander("🎬 Why We Think You’ll Love This", expanded=False):
-                    try:
-                        explanation = generate_ai_explanation(user_profile, row, st.session_state.gemini_api_key)
+                    explanation = explanations.get(row['movie_id'])
+                    if explanation:
                         st.write(explanation)
-                    except Exception as e:
+                    else:
                         st.write("Could not generate explanation. Please check your API key.")
             
 
             movie_id = row['movie_id'] 
-            current_rating = user_ratings.get(movie_id, 0)
-            rating = st.selectbox(
-                "Rate this movie", 
-                options=[0, 1, 2, 3, 4, 5], 
-                index=current_rating,
-                key=f"rating_{tab_name}_{movie_id}_{idx}", # Ensure unique key
-                label_visibility="collapsed"
-            )
+            rating_widget(user_state, movie_id, key=f"rating_{tab_name}_{movie_id}_{idx}") # Ensure unique key
             
-            if rating != current_rating and rating > 3:
-                save_rating(user_id, movie_id, rating)
-                st.success("Saved!")
-                st.rerun()
+            if allow_similar and st.button("More like this", key=f"similar_{tab_name}_{movie_id}_{idx}"):
+                st.session_state[f"similar_{tab_name}"] = (movie_id, row['title'])
             
             st.markdown("---")
 
+    if pages > 1:
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("◀ Previous", key=f"prev_{page_key}", disabled=page == 0,
+                        on_click=_set_page, args=(page_key, page - 1))
+        info_col.caption(f"Page {page + 1} of {pages}")
+        next_col.button("Next ▶", key=f"next_{page_key}", disabled=page == pages - 1,
+                        on_click=_set_page, args=(page_key, page + 1))
+
+    similar_to = st.session_state.get(f"similar_{tab_name}")
+    if allow_similar and similar_to is not None:
+        movie_id, title = similar_to
+        st.subheader(f"🎞️ More like {title}")
+        st.button("Close", key=f"close_similar_{tab_name}", on_click=st.session_state.pop,
+                  args=(f"similar_{tab_name}", None))
+        similar = get_similar_movies(movie_id, top_k=8)
+        if len(similar) == 0:
+            st.info("No similar titles found for this movie yet.")
+        else:
+            show_movie_grid(similar, user_state, f"{tab_name}_similar", False, allow_similar=False)
+
+# st.rerun() and st.stop() end a run before its timing trace is stopped, and the
+# script thread keeps the trace current into the next run unless it is dropped here
+metrics.clear_trace()
+
 if 'user_id' not in st.session_state:
     st.session_state.user_id = None
 if 'username' not in st.session_state:
     st.session_state.username = None
+if 'user_state' not in st.session_state:
+    st.session_state.user_state = None
 
 st.set_page_config(page_title="🎬 MovieReel AI", layout="wide")
 
@@ -75,6 +132,7 @@ with col2:
         if st.button("Logout"):
             st.session_state.user_id = None
             st.session_state.username = None
+            st.session_state.user_state = None
             st.rerun()
     else:
         st.write("👤 Not logged in")
@@ -104,9 +162,16 @@ if not st.session_state.user_id:
     st.stop()
 
 
+show_timings = st.sidebar.checkbox("⏱️ Show timing breakdown", value=False,
+                                   help="Time every stage of this page and list them after it renders")
+rerun_trace = metrics.Trace('rerun').start() if show_timings else None
+
 user_id = st.session_state.user_id
-rating_count = get_rating_count(user_id)
-user_ratings_df = get_user_ratings(user_id)
+if st.session_state.user_state is None or st.session_state.user_state.user_id != user_id:
+    st.session_state.user_state = UserState(user_id)
+user_state = st.session_state.user_state
+rating_count = user_state.rating_count
+user_ratings_df = user_state.ratings_df
 
 st.progress(min(rating_count / 15, 1.0))
 if rating_count < 10:
@@ -116,15 +181,17 @@ elif rating_count < 20:
 else:
     st.success("🔥 You're in **Deep Learning Mode** — powered by NCF!")
 
-tab1, tab2, tab3,tab4 = st.tabs(["General Recommendations", "Personalized Recommendations","NCF Recommenadation","Know Your Style"])
+# Only the selected section runs, so opening one never computes the others' recommendations
+TABS = ["General Recommendations", "Personalized Recommendations","NCF Recommenadation","Hybrid Recommendations","Know Your Style"]
+active_tab = st.radio("Section", TABS, key="active_tab", horizontal=True, label_visibility="collapsed")
 
-with tab1:
+if active_tab == TABS[0]:
     st.subheader("🔮 Popular Films for Everyone")
     with st.spinner("Finding the best recent films..."):
         recs = get_general_recommendations()
-    show_movie_grid(recs, user_id,'general',False)
+    show_movie_grid(recs, user_state,'general',False)
 
-with tab2:
+if active_tab == TABS[1]:
     if rating_count < 10:
         st.info("🔒 Unlock this tab by rating 10 movies")
     else:
@@ -155,39 +222,58 @@ with tab2:
                 st.warning("Please save your API key first")
 
         with st.spinner("Building recommendations tailored to your cinematic taste..."):
-            recs = get_content_based_recommendations(user_ratings_df)
+            recs = get_recommendations('content', user_ratings_df, user_id=user_id)
         
         if ai_mode:
-            show_movie_grid(recs, user_id, 'personal', ai_mode=True)
+            show_movie_grid(recs, user_state, 'personal', ai_mode=True)
         else:
-            show_movie_grid(recs, user_id, 'personal', ai_mode=False)
+            show_movie_grid(recs, user_state, 'personal', ai_mode=False)
 
 
-with tab3:
+if active_tab == TABS[2]:
     if rating_count < 20:
         st.info("🔒 Unlock this tab by rating 20 movies")
     else:
         st.subheader("🧠 Deep Learning Recommendations")
         st.write("People with tastes like yours are loving these")
         with st.spinner("Curating your cinematic journey..."):
-            recs = get_ncf_recommendations(user_ratings_df)
-            show_movie_grid(recs, user_id,'get_ncf_recommedation',False)
+            recs = get_recommendations('ncf', user_ratings_df, user_id=user_id)
+            show_movie_grid(recs, user_state,'get_ncf_recommedation',False)
 
-with tab4:
+if active_tab == TABS[3]:
+    if rating_count < 20:
+        st.info("🔒 Unlock this tab by rating 20 movies")
+    else:
+        st.subheader("⚖️ Hybrid Recommendations")
+        st.write("NCF, director and genre picks reranked by content match, embedding similarity and quality")
+        with st.spinner("Blending your recommendations..."):
+            recs = get_recommendations('hybrid', user_ratings_df, user_id=user_id)
+            show_movie_grid(recs, user_state,'hybrid',False)
+
+if active_tab == TABS[4]:
     if rating_count < 10:
         st.info("🔒 Unlock this tab by rating 10 movies")
     else:
         if st.button('DO THE MAGIC'):
 
             st.subheader(" 🎬 Your Cinematic DNA")
-            with st.spinner("Developing Your Profile"):
-                st.write(get_personality(
-                    user_ratings_df
-                ))
-            with st.spinner("Mapping Your Taste"):
-                st.subheader("\n\n ⏳ Your Taste Evolution")
-                st.write(get_taste_evolution(
-                    user_ratings_df
-                ))
-
+            panels = {'personality': st.empty()}
+            panels['personality'].caption("Developing Your Profile...")
+            st.subheader("\n\n ⏳ Your Taste Evolution")
+            panels['taste_evolution'] = st.empty()
+            panels['taste_evolution'].caption("Mapping Your Taste...")
+            for panel, text in stream_insights(user_ratings_df, user_id, st.session_state.get('gemini_api_key')):
+                panels[panel].markdown(text)
 
+if rerun_trace is not None:
+    rerun_trace.stop()
+    with st.sidebar.expander("⏱️ Timing breakdown", expanded=True):
+        st.caption(f"This rerun took {rerun_trace.seconds * 1000:.0f} ms (nested stages overlap)")
+        breakdown = pd.DataFrame(rerun_trace.breakdown(), columns=['stage', 'calls', 'seconds', 'share'])
+        breakdown['ms'] = (breakdown.pop('seconds') * 1000).round(1)
+        breakdown['share'] = (breakdown['share'] * 100).round(1).astype(str) + '%'
+        st.dataframe(breakdown, hide_index=True, use_container_width=True)
+        if rerun_trace.counts:
+            st.json(rerun_trace.counts)
+        st.download_button("Download trace (JSON)", rerun_trace.to_json(), file_name="rerun_trace.json",
+                           mime="application/json")
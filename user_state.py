@@ -0,0 +1,55 @@
+from catalog import liked_profile
+from database import get_taste_profile, get_user_ratings, save_rating
+
+
+class UserState:
+    """Per-session snapshot of one user's ratings and derived taste profile.
+
+    Loaded on first access and kept until `rate` reports that a rating really
+    changed, so a Streamlit rerun does not query the ratings table again.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._ratings_df = None
+        self._ratings = None
+        self._profile = None
+
+    def _load(self):
+        self._ratings_df = get_user_ratings(self.user_id)
+        self._ratings = dict(zip(self._ratings_df['movie_id'], self._ratings_df['rating']))
+        self._profile = liked_profile(get_taste_profile(self.user_id))
+
+    @property
+    def ratings_df(self):
+        if self._ratings_df is None:
+            self._load()
+        return self._ratings_df
+
+    @property
+    def ratings(self):
+        """{movie_id: rating}"""
+        if self._ratings is None:
+            self._load()
+        return self._ratings
+
+    @property
+    def rating_count(self):
+        return len(self.ratings)
+
+    @property
+    def profile(self):
+        """liked_directors / liked_actors / liked_genres sets"""
+        if self._profile is None:
+            self._load()
+        return self._profile
+
+    def invalidate(self):
+        self._ratings_df = self._ratings = self._profile = None
+
+    def rate(self, movie_id, rating):
+        """Save a rating; returns True if it changed anything"""
+        changed = save_rating(self.user_id, movie_id, rating)
+        if changed:
+            self.invalidate()
+        return changed